@@ -2,12 +2,17 @@ import asyncio
 import json
 import logging
 import os
+import time
 from urllib.parse import urlparse
 
 import aiohttp
 import aioari
 from dotenv import load_dotenv
 
+from api import profiler
+from api import supervisor
+from api.tracing import start_call, span
+
 load_dotenv()
 
 ARI_BASE_URL = os.getenv("ARI_BASE_URL", "").strip()  # например: http://192.168.1.100:8088/ari
@@ -26,11 +31,14 @@ RTP_FORMAT = (os.getenv("RTP_FORMAT", "ulaw") or "ulaw").strip().lower()
 if RTP_FORMAT not in ("ulaw", "slin", "slin16"):
     RTP_FORMAT = "ulaw"
 
+ARI_PROFILE_ADMIN_PORT = int(os.getenv("ARI_PROFILE_ADMIN_PORT", "0"))
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger("ARI")
 
 ari = None
-sessions = {}  # key=channel_id -> {bridge_id, external_id}
+sessions = {}  # key=channel_id -> {bridge_id, external_id, rtp_port}
+media_shm = None
 
 
 def _ari_http_base() -> str:
@@ -50,6 +58,40 @@ def _ari_ws_url() -> str:
     return f"ws://{ARI_HOST}:{ARI_PORT}/ari/events?app={ARI_APP_NAME}&api_key={ARI_USER}:{ARI_PASSWORD}"
 
 
+def pick_rtp_port() -> int:
+    """
+    Порт media-воркера для нового звонка. Если запущен супервизор (api.supervisor),
+    выбираем среди принимающих звонки воркеров тот, где у нас меньше всего активных звонков;
+    иначе — одиночный media_server на RTP_PORT.
+    """
+    global media_shm
+
+    if media_shm is None:
+        media_shm = supervisor.attach()
+    if media_shm is None:
+        return RTP_PORT
+
+    try:
+        # воркер публикует heartbeat раз в секунду; молчащий дольше — считаем мёртвым
+        fresh = time.time() - 5
+        ports = [st["port"] for st in supervisor.read_worker_states(media_shm)
+                 if st["state"] == supervisor.STATE_ACCEPTING and st["heartbeat"] >= fresh]
+    except Exception as e:
+        log.warning(f"Cannot read media worker states: {e}")
+        ports = []
+    if not ports:
+        # сегмент мог остаться от остановленного супервизора — переподключимся в следующий раз
+        media_shm.close()
+        media_shm = None
+        return RTP_PORT
+
+    load = {p: 0 for p in ports}
+    for data in sessions.values():
+        if data.get("rtp_port") in load:
+            load[data["rtp_port"]] += 1
+    return min(ports, key=lambda p: load[p])
+
+
 def is_external_channel(channel: dict) -> bool:
     name = channel.get("name", "") or ""
     return name.startswith("UnicastRTP/") or "UnicastRTP" in name or name.startswith("ExternalMedia/")
@@ -90,31 +132,40 @@ async def handle_stasis_start(event: dict):
         return
 
     log.info(f"StasisStart: {channel_name} ({channel_id})")
+    trace = start_call(channel_id)
 
     try:
-        await ari.channels.answer(channelId=channel_id)
+        with span(trace, "answer"):
+            await ari.channels.answer(channelId=channel_id)
 
-        bridge = await ari.bridges.create(type="mixing")
-        await ari.bridges.addChannel(bridgeId=bridge.id, channel=channel_id)
+        with span(trace, "bridge"):
+            bridge = await ari.bridges.create(type="mixing")
+            await ari.bridges.addChannel(bridgeId=bridge.id, channel=channel_id)
 
-        # ExternalMedia: Asterisk будет слать RTP на UBUNTU_IP:RTP_PORT
-        ext = await ari.channels.externalMedia(
-            app=ARI_APP_NAME,
-            external_host=f"{UBUNTU_IP}:{RTP_PORT}",
-            format=RTP_FORMAT,          # ulaw
-            direction="both",
-            encapsulation="rtp",
-        )
+        # ExternalMedia: Asterisk будет слать RTP на UBUNTU_IP:rtp_port
+        rtp_port = pick_rtp_port()
+        with span(trace, "external_media"):
+            ext = await ari.channels.externalMedia(
+                app=ARI_APP_NAME,
+                external_host=f"{UBUNTU_IP}:{rtp_port}",
+                format=RTP_FORMAT,          # ulaw
+                direction="both",
+                encapsulation="rtp",
+            )
 
-        await ari.bridges.addChannel(bridgeId=bridge.id, channel=ext.id)
+            await ari.bridges.addChannel(bridgeId=bridge.id, channel=ext.id)
 
-        sessions[channel_id] = {"bridge_id": bridge.id, "external_id": ext.id}
-        log.info(f"Connected ExternalMedia to {UBUNTU_IP}:{RTP_PORT} format={RTP_FORMAT}")
+        sessions[channel_id] = {"bridge_id": bridge.id, "external_id": ext.id, "rtp_port": rtp_port}
+        log.info(f"Connected ExternalMedia to {UBUNTU_IP}:{rtp_port} format={RTP_FORMAT}")
 
     except Exception as e:
         log.error(f"Call setup failed: {e}")
         await cleanup(channel_id)
 
+    finally:
+        if trace:
+            trace.flush("setup")
+
 
 async def handle_stasis_end(event: dict):
     channel = event.get("channel") or {}
@@ -127,6 +178,8 @@ async def handle_stasis_end(event: dict):
 async def main():
     global ari
 
+    profiler.install("ari_handler", ARI_PROFILE_ADMIN_PORT)
+
     ari_http = _ari_http_base()
     ws_url = _ari_ws_url()
 
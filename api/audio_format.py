@@ -0,0 +1,113 @@
+import math
+import audioop
+
+try:
+    import numpy as np
+except ImportError:  # без numpy работаем через audioop.ratecv
+    np = None
+
+FRAME_MS = 20
+# выходных отсчётов за один проход ресемплера
+RESAMPLE_BLOCK = 8192
+
+# формат ExternalMedia в Asterisk -> частота дискретизации
+FORMAT_RATES = {
+    "ulaw": 8000,
+    "slin": 8000,
+    "slin16": 16000,
+}
+
+
+class MediaFormat:
+    """
+    Согласованный формат RTP-потока: из него выводятся размер кадра,
+    шаг RTP timestamp и частота, в которой живёт PCM внутри media_server.
+    """
+
+    def __init__(self, name: str):
+        name = (name or "ulaw").strip().lower()
+        if name not in FORMAT_RATES:
+            raise RuntimeError("RTP_FORMAT must be ulaw or slin/slin16")
+
+        self.name = name
+        self.sample_rate = FORMAT_RATES[name]
+        self.is_ulaw = name == "ulaw"
+        self.sample_width = 1 if self.is_ulaw else 2                 # байт на сэмпл в payload
+        self.frame_samples = self.sample_rate * FRAME_MS // 1000      # = шаг RTP timestamp
+        self.frame_bytes = self.frame_samples * self.sample_width     # payload одного кадра
+        self.silence_byte = b"\xff" if self.is_ulaw else b"\x00"
+
+    def payload_to_pcm(self, payload: bytes) -> bytes:
+        if self.is_ulaw:
+            return audioop.ulaw2lin(payload, 2)
+        # slin/slin16: это уже PCM s16le
+        return payload
+
+    def pcm_to_payload(self, pcm_s16le: bytes) -> bytes:
+        if self.is_ulaw:
+            return audioop.lin2ulaw(pcm_s16le, 2)
+        return pcm_s16le
+
+    def __repr__(self):
+        return f"MediaFormat({self.name}, {self.sample_rate} Hz, {self.frame_bytes} B/frame)"
+
+
+_filter_cache = {}
+
+
+def _polyphase_filter(up: int, down: int, half_taps: int = 16):
+    """
+    ФНЧ (windowed sinc, окно Кайзера) для ресемплинга up/down,
+    разложенный на up фаз: форма (up, taps_per_phase).
+    Длина фильтра нечётная, чтобы центр попадал точно в отсчёт (без дробной задержки).
+    """
+    key = (up, down, half_taps)
+    bank = _filter_cache.get(key)
+    if bank is not None:
+        return bank
+
+    taps_per_phase = 2 * half_taps
+    length = taps_per_phase * up - 1
+    n = np.arange(length) - (length - 1) // 2
+    cutoff = 0.95 / max(up, down)  # частота среза относительно промежуточной частоты
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(length, 8.0)
+    h = np.append(h * (up / h.sum()), 0.0)
+
+    # фаза p берёт коэффициенты h[p], h[p+up], ...; разворот — для свёртки через скалярное произведение
+    bank = h.reshape(taps_per_phase, up).T[:, ::-1].astype(np.float32)
+    _filter_cache[key] = bank
+    return bank
+
+
+def resample(pcm_s16le: bytes, rate_in: int, rate_out: int) -> bytes:
+    """
+    Пакетный ресемплинг PCM s16le mono (целое высказывание/ответ TTS целиком).
+    С numpy — векторизованный полифазный фильтр, без него — audioop.ratecv.
+    """
+    if rate_in == rate_out or not pcm_s16le:
+        return pcm_s16le
+
+    if np is None:
+        out, _state = audioop.ratecv(pcm_s16le, 2, 1, rate_in, rate_out, None)
+        return out
+
+    g = math.gcd(rate_in, rate_out)
+    up, down = rate_out // g, rate_in // g
+    bank = _polyphase_filter(up, down)
+    taps = bank.shape[1]
+    center = (taps * up - 2) // 2
+
+    x = np.frombuffer(pcm_s16le, dtype="<i2").astype(np.float32)
+    n_out = len(x) * up // down
+
+    xp = np.concatenate([np.zeros(taps - 1, np.float32), x, np.zeros(taps, np.float32)])
+    # окна входа — view без копирования; матрица (блок x taps) собирается по блокам,
+    # так что сверх входа и выхода память не зависит от длины высказывания
+    windows = np.lib.stride_tricks.sliding_window_view(xp, taps)
+    y = np.empty(n_out, np.float32)
+    for i in range(0, n_out, RESAMPLE_BLOCK):
+        # выходной отсчёт k лежит на позиции k*down промежуточной (в up раз более частой) сетки
+        pos = np.arange(i, min(i + RESAMPLE_BLOCK, n_out)) * down + center
+        y[i:i + len(pos)] = np.einsum("ij,ij->i", windows[pos // up], bank[pos % up])
+
+    return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
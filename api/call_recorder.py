@@ -0,0 +1,327 @@
+import os
+import time
+import struct
+import audioop
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+from api import metrics
+
+load_dotenv()
+
+RECORD_DIR = (os.getenv("RECORD_DIR", "") or "").strip()
+RECORD_FORMAT = (os.getenv("RECORD_FORMAT", "ulaw") or "ulaw").strip().lower()  # wav | ulaw | raw
+RECORD_QUEUE_FRAMES = int(os.getenv("RECORD_QUEUE_FRAMES", "5000"))
+RECORD_SEGMENT_SEC = int(os.getenv("RECORD_SEGMENT_SEC", "300"))
+RECORD_FSYNC_SEC = float(os.getenv("RECORD_FSYNC_SEC", "2"))
+RECORD_IDLE_SEC = float(os.getenv("RECORD_IDLE_SEC", "30"))
+# паузы короче этого (jitter входящего RTP) тишиной не заполняются
+RECORD_ALIGN_SLACK_MS = float(os.getenv("RECORD_ALIGN_SLACK_MS", "100"))
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+class _SegmentWriter:
+    """
+    Один файл-сегмент одного направления звонка.
+    Заголовок WAV пишется сразу и переписывается при каждом fsync и при закрытии,
+    так что после падения процесса файл читается целиком до последнего fsync.
+    """
+
+    def __init__(self, path: str, fmt: str, sample_rate: int):
+        self.path = path
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        # "xb": уже записанный файл не перезаписывается ни при каких условиях
+        self.f = open(path, "xb")
+        self.data_bytes = 0
+        if fmt != "raw":
+            self._write_header()
+
+    def _header(self) -> bytes:
+        if self.fmt == "ulaw":
+            # μ-law: fmt-чанк 18 байт (cbSize=0) + fact-чанк с числом сэмплов
+            fmt_chunk = struct.pack("<4sIHHIIHHH", b"fmt ", 18, WAVE_FORMAT_MULAW, 1,
+                                    self.sample_rate, self.sample_rate, 1, 8, 0)
+            fact_chunk = struct.pack("<4sII", b"fact", 4, self.data_bytes)
+        else:
+            fmt_chunk = struct.pack("<4sIHHIIHH", b"fmt ", 16, WAVE_FORMAT_PCM, 1,
+                                    self.sample_rate, self.sample_rate * 2, 2, 16)
+            fact_chunk = b""
+        body = b"WAVE" + fmt_chunk + fact_chunk + struct.pack("<4sI", b"data", self.data_bytes)
+        return struct.pack("<4sI", b"RIFF", len(body) + self.data_bytes) + body
+
+    def _write_header(self):
+        self.f.seek(0)
+        self.f.write(self._header())
+        self.f.seek(0, os.SEEK_END)
+
+    def write(self, data: bytes):
+        self.f.write(data)
+        self.data_bytes += len(data)
+
+    def sync(self):
+        if self.fmt != "raw":
+            self._write_header()
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.sync()
+        self.f.close()
+
+
+class CallRecorder:
+    """
+    Архив аудио звонков вне RTP-цикла.
+
+    push() только кладёт кадр в ограниченную очередь (deque.append атомарен под GIL,
+    блокировок нет); если очередь заполнена — кадр отбрасывается и считается в dropped.
+    Фоновый поток перекодирует кадры, пишет сегменты по направлениям (in/out),
+    ротирует их по длительности и делает fsync пачкой раз в RECORD_FSYNC_SEC.
+
+    Оба направления идут на общей шкале времени звонка (от первого кадра любого
+    направления, по времени push): паузы дольше RECORD_ALIGN_SLACK_MS заполняются
+    тишиной, поэтому склеенные по порядку сегменты in и out совпадают по времени.
+    """
+
+    def __init__(self, out_dir: str, fmt: str = RECORD_FORMAT, sample_rate: int = 8000,
+                 max_frames: int = RECORD_QUEUE_FRAMES, segment_sec: int = RECORD_SEGMENT_SEC,
+                 fsync_sec: float = RECORD_FSYNC_SEC, idle_sec: float = RECORD_IDLE_SEC,
+                 align_slack_ms: float = RECORD_ALIGN_SLACK_MS):
+        if fmt not in ("wav", "ulaw", "raw"):
+            raise RuntimeError("RECORD_FORMAT must be wav, ulaw or raw")
+
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        self.max_frames = max_frames
+        self.segment_sec = segment_sec
+        self.fsync_sec = fsync_sec
+        self.idle_sec = idle_sec
+
+        self.sample_width = 1 if fmt == "ulaw" else 2
+        self.silence = b"\xff" if fmt == "ulaw" else b"\x00\x00"
+        self.segment_bytes = segment_sec * sample_rate * self.sample_width
+        self.slack_bytes = int(align_slack_ms * sample_rate / 1000) * self.sample_width
+
+        self.queue = deque()
+        self.dropped = 0
+        self.written_frames = 0
+        # уже отданные в metrics значения счётчиков
+        self._reported_dropped = 0
+        self._reported_written = 0
+        # ошибки диска: счётчик и последняя ошибка для строки в лог раз в интервал отчёта;
+        # направление звонка после ошибки больше не пишется (кадры считаются в skipped_frames)
+        self.write_errors = 0
+        self.skipped_frames = 0
+        self.last_error = ""
+        self._reported_errors = 0
+        self._reported_skipped = 0
+
+        # call_tag -> {"origin": время первого кадра,
+        #              "dirs": direction -> [writer | None, segment_no, last_write_ts, segment_start_bytes, failed]}
+        # после закрытия по простою writer = None, а номер и позиция сохраняются до end_call()
+        self.calls = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="call-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def push(self, call_tag: str, direction: str, data: bytes, encoding: str):
+        """
+        Горячий путь: без I/O и без блокировок.
+        encoding — формат data: "ulaw" или "slin" (PCM s16le).
+        """
+        if len(self.queue) >= self.max_frames:
+            self.dropped += 1
+            return
+        self.queue.append((call_tag, direction, data, encoding, time.monotonic()))
+
+    def end_call(self, call_tag: str):
+        """
+        Звонок завершён: сегменты закрываются, состояние звонка удаляется.
+        Маркер не отбрасывается при полной очереди.
+        """
+        self.queue.append((call_tag, None, None, None, time.monotonic()))
+
+    def _convert(self, data: bytes, encoding: str) -> bytes:
+        if self.fmt == "ulaw":
+            return data if encoding == "ulaw" else audioop.lin2ulaw(data, 2)
+        return audioop.ulaw2lin(data, 2) if encoding == "ulaw" else data
+
+    def _open_segment(self, call_tag: str, direction: str, segment_no: int) -> tuple[_SegmentWriter, int]:
+        """
+        Открывает сегмент с первым свободным номером начиная с segment_no:
+        после закрытия по простою (или рестарта процесса) запись продолжается
+        в новый файл, а не затирает прежний.
+        """
+        # raw — это s16le без заголовка: расширение .s16 однозначно читается vad_eval
+        ext = "s16" if self.fmt == "raw" else "wav"
+        while True:
+            path = os.path.join(self.out_dir, f"{call_tag}_{direction}_{segment_no:03d}.{ext}")
+            try:
+                return _SegmentWriter(path, self.fmt, self.sample_rate), segment_no
+            except FileExistsError:
+                segment_no += 1
+
+    @staticmethod
+    def _close_entry(entry: list):
+        writer = entry[0]
+        writer.close()
+        entry[0] = None
+        entry[1] += 1
+        entry[3] += writer.data_bytes
+
+    def _error(self, where: str, e: Exception):
+        self.write_errors += 1
+        self.last_error = f"{where}: {e}"
+
+    def _fail(self, entry: list, where: str, e: Exception):
+        """
+        Ошибка открытия/записи/fsync: направление звонка выключается до end_call(),
+        а не повторяет ошибку на каждом кадре.
+        """
+        self._error(where, e)
+        writer = entry[0]
+        if writer is not None:
+            try:
+                writer.f.close()
+            except OSError:
+                pass
+        entry[0] = None
+        entry[4] = True
+
+    def _append(self, call_tag: str, direction: str, entry: list, data: bytes):
+        """
+        Дописывает data, переходя в следующий сегмент на границе RECORD_SEGMENT_SEC.
+        """
+        while data:
+            if entry[0] is not None and entry[0].data_bytes >= self.segment_bytes:
+                self._close_entry(entry)
+            if entry[0] is None:
+                entry[0], entry[1] = self._open_segment(call_tag, direction, entry[1])
+            room = self.segment_bytes - entry[0].data_bytes
+            entry[0].write(data[:room])
+            data = data[room:]
+
+    def _write(self, call_tag: str, direction: str, data: bytes, ts: float):
+        call = self.calls.setdefault(call_tag, {"origin": ts, "dirs": {}})
+        entry = call["dirs"].get(direction)
+        if entry is None:
+            entry = [None, 0, ts, 0, False]
+            call["dirs"][direction] = entry
+        if entry[4]:
+            self.skipped_frames += 1
+            return
+
+        try:
+            # отставание файла от времени звонка: пауза в этом направлении -> тишина
+            position = entry[3] + (entry[0].data_bytes if entry[0] is not None else 0)
+            target = int((ts - call["origin"]) * self.sample_rate) * self.sample_width
+            gap = target - position
+            if gap > self.slack_bytes:
+                chunk = self.silence * self.sample_rate
+                while gap > 0:
+                    self._append(call_tag, direction, entry, chunk[:gap])
+                    gap -= len(chunk)
+
+            self._append(call_tag, direction, entry, data)
+        except OSError as e:
+            self._fail(entry, f"{call_tag}/{direction}", e)
+            self.skipped_frames += 1
+            return
+        entry[2] = ts
+        self.written_frames += 1
+
+    def _end_call(self, call_tag: str):
+        call = self.calls.pop(call_tag, None)
+        if call is None:
+            return
+        for direction, entry in call["dirs"].items():
+            if entry[0] is not None:
+                try:
+                    self._close_entry(entry)
+                except OSError as e:
+                    self._fail(entry, f"{call_tag}/{direction}", e)
+
+    def _sync_all(self):
+        for call_tag, call in self.calls.items():
+            for direction, entry in call["dirs"].items():
+                if entry[0] is not None:
+                    try:
+                        entry[0].sync()
+                    except OSError as e:
+                        self._fail(entry, f"{call_tag}/{direction}", e)
+
+    def _report(self):
+        """
+        Счётчики в metrics; о новых потерях кадров и ошибках диска — не больше
+        одной строки в лог за интервал.
+        """
+        dropped, written = self.dropped, self.written_frames
+        errors, skipped = self.write_errors, self.skipped_frames
+        if dropped > self._reported_dropped:
+            print(f"[recorder] queue full: dropped {dropped - self._reported_dropped} frames "
+                  f"({dropped} total)")
+        if errors > self._reported_errors:
+            print(f"[recorder] {errors - self._reported_errors} write errors ({errors} total), "
+                  f"last: {self.last_error}")
+        metrics.inc("recorder.dropped", dropped - self._reported_dropped)
+        metrics.inc("recorder.written_frames", written - self._reported_written)
+        metrics.inc("recorder.write_errors", errors - self._reported_errors)
+        metrics.inc("recorder.skipped_frames", skipped - self._reported_skipped)
+        metrics.set_gauge("recorder.queue", len(self.queue))
+        self._reported_dropped, self._reported_written = dropped, written
+        self._reported_errors, self._reported_skipped = errors, skipped
+
+    def _close_idle(self, now: float):
+        for call_tag, call in self.calls.items():
+            for direction, entry in call["dirs"].items():
+                if entry[0] is not None and now - entry[2] >= self.idle_sec:
+                    try:
+                        self._close_entry(entry)
+                    except OSError as e:
+                        self._fail(entry, f"{call_tag}/{direction}", e)
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            stopping = self._stop.is_set()
+            wrote = False
+            while self.queue:
+                call_tag, direction, data, encoding, ts = self.queue.popleft()
+                try:
+                    if direction is None:
+                        self._end_call(call_tag)
+                    else:
+                        self._write(call_tag, direction, self._convert(data, encoding), ts)
+                    wrote = True
+                except Exception as e:
+                    self._error(f"{call_tag}/{direction}", e)
+
+            now = time.monotonic()
+            if stopping:
+                for call_tag in list(self.calls):
+                    self._end_call(call_tag)
+                self._report()
+                return
+
+            if now - last_sync >= self.fsync_sec:
+                self._sync_all()
+                self._close_idle(now)
+                self._report()
+                last_sync = now
+
+            if not wrote:
+                time.sleep(0.05)
@@ -0,0 +1,71 @@
+import os
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# динамический payload type telephone-event (в Asterisk обычно 101)
+DTMF_PAYLOAD_TYPE = int(os.getenv("DTMF_PAYLOAD_TYPE", "101"))
+# JSON {"1": "текст ответа", ...}; пусто — цифры только логируются
+DTMF_ROUTES_FILE = (os.getenv("DTMF_ROUTES_FILE", "") or "").strip()
+
+# RFC 4733, 3.2: коды событий 0-15
+EVENT_DIGITS = "0123456789*#ABCD"
+
+
+def parse_event(payload: bytes):
+    """
+    telephone-event payload: event(8) | E(1) R(1) volume(6) | duration(16).
+    Возвращает (event, end, duration) или None.
+    """
+    if len(payload) < 4:
+        return None
+    event = payload[0]
+    end = bool(payload[1] & 0x80)
+    duration = int.from_bytes(payload[2:4], "big")
+    return event, end, duration
+
+
+class DtmfDetector:
+    """
+    Сборка нажатий из пакетов telephone-event.
+
+    Все пакеты одного нажатия несут один RTP timestamp, а пакет с битом E
+    повторяется (обычно трижды). Цифра выдаётся один раз — по первому пакету
+    с E для нового timestamp.
+    """
+
+    def __init__(self):
+        self.last_ts = None
+
+    def push(self, rtp_ts: int, payload: bytes):
+        parsed = parse_event(payload)
+        if not parsed:
+            return None
+        event, end, _duration = parsed
+        if not end or rtp_ts == self.last_ts or event >= len(EVENT_DIGITS):
+            return None
+        self.last_ts = rtp_ts
+        return EVENT_DIGITS[event]
+
+
+def load_routes(path: str = DTMF_ROUTES_FILE) -> dict:
+    """
+    Маршруты цифра -> текст ответа. Ошибка в файле не роняет сервер: маршрутов просто нет.
+    """
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"[dtmf] cannot load routes from {path}: {e}")
+        return {}
+    routes = {}
+    for k, v in data.items():
+        key = str(k)
+        if len(key) == 1 and key in EVENT_DIGITS and v:
+            routes[key] = str(v)
+        else:
+            print(f"[dtmf] ignoring route {key!r}: key must be one of {EVENT_DIGITS} with a non-empty reply")
+    return routes
@@ -1,26 +1,68 @@
 import os
+import atexit
 import socket
 import time
-import audioop
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from collections import deque
 from dotenv import load_dotenv
 
-from api.yandex_stt import recognize_pcm
+from api.yandex_stt import recognize_audio
 from api.yandex_tts import synthesize_pcm
 from api.llm_client import chat
+from api.call_recorder import CallRecorder, RECORD_DIR
+from api.audio_format import MediaFormat, FRAME_MS, resample
+from api.scheduler import TurnScheduler
+from api.playout import PlayoutPacer
+from api import metrics
+from api import profiler
+from api.tracing import start_call, span
+from api.vad import UtteranceSegmenter, RMS_SPEECH_THRESHOLD, MIN_UTTERANCE_MS, END_SILENCE_MS
+from api.stt_conditioning import condition_for_stt, encode_for_upload
+from api.dtmf import DtmfDetector, DTMF_PAYLOAD_TYPE, load_routes
+from api.supervisor import DRAIN_TIMEOUT_SEC
+from api.rtcp import ReceiverStats, SenderStats, build_sr, build_rr, build_sdes_cname, build_bye, parse_rtcp
 
 load_dotenv()
 
 RTP_PORT = int(os.getenv("RTP_PORT", os.getenv("RTP_IN_PORT", "4000")))
 RTP_FORMAT = (os.getenv("RTP_FORMAT", "ulaw") or "ulaw").strip().lower()
-SAMPLE_RATE = int(os.getenv("RTP_SAMPLE_RATE", "8000"))
 
-RMS_SPEECH_THRESHOLD = int(os.getenv("RMS_SPEECH_THRESHOLD", "200"))
-MIN_UTTERANCE_MS = int(os.getenv("MIN_UTTERANCE_MS", "800"))
-END_SILENCE_MS = int(os.getenv("END_SILENCE_MS", "700"))
+# частота, размер кадра и шаг timestamp выводятся из одного согласованного формата
+MEDIA = MediaFormat(RTP_FORMAT)
+SAMPLE_RATE = MEDIA.sample_rate
 
-FRAME_MS = 20
-executor = ThreadPoolExecutor(max_workers=4)
+# частоты провайдеров; при расхождении с трактом аудио ресемплится пакетно
+STT_SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", str(SAMPLE_RATE)))
+TTS_SAMPLE_RATE = int(os.getenv("TTS_SAMPLE_RATE", str(SAMPLE_RATE)))
+
+METRICS_LOG_SEC = float(os.getenv("METRICS_LOG_SEC", "60"))
+PROFILE_ADMIN_PORT = int(os.getenv("PROFILE_ADMIN_PORT", "0"))
+
+# RTCP на соседнем порту RTP_PORT+1
+RTCP_ENABLED = os.getenv("RTCP_ENABLED", "1") == "1"
+RTCP_INTERVAL_SEC = float(os.getenv("RTCP_INTERVAL_SEC", "5"))
+# звонок считается завершённым, если RTP не приходит столько секунд
+SESSION_IDLE_SEC = float(os.getenv("SESSION_IDLE_SEC", "15"))
+
+GREETING_PROMPT = (
+    "Здравствуйте. Вы позвонили в техническую поддержку компании СКС сервис. "
+    "Опишите, пожалуйста, вашу проблему."
+)
+BUSY_PROMPT = (
+    "Здравствуйте. Сейчас все операторы заняты. "
+    "Пожалуйста, перезвоните через несколько минут."
+)
+
+# цифра DTMF -> готовый ответ без STT/LLM/TTS
+DTMF_ROUTES = load_routes()
+
+# ходы диалога (STT -> LLM -> TTS): по одному на звонок, с ограничением очереди
+scheduler = TurnScheduler()
+# исходящее аудио всех звонков: один поток с графиком 20ms, потоки ходов не ждут воспроизведения
+pacer = PlayoutPacer(FRAME_MS / 1000.0)
+
+# архив звонков: включается заданием RECORD_DIR
+recorder = CallRecorder(RECORD_DIR, sample_rate=SAMPLE_RATE) if RECORD_DIR else None
 
 
 def parse_rtp(pkt: bytes):
@@ -81,21 +123,34 @@ def build_rtp(pt: int, seq: int, ts: int, ssrc: int, payload: bytes) -> bytes:
 
 
 class Session:
-    def __init__(self, sock: socket.socket, addr, pt: int, ssrc_in: int):
+    def __init__(self, sock: socket.socket, addr, pt: int, ssrc_in: int, rtcp_sock: socket.socket = None):
         self.sock = sock
+        self.rtcp_sock = rtcp_sock
         self.addr = addr
         self.pt = pt
         self.ssrc_in = ssrc_in
+        self.call_tag = f"{time.strftime('%Y%m%d_%H%M%S')}_{ssrc_in:08x}"
+        self.rec_encoding = "ulaw" if MEDIA.is_ulaw else "slin"
+        self.trace = start_call(self.call_tag)
+        self.rtcp_addr = (addr[0], addr[1] + 1)
 
         self.out_seq = int.from_bytes(os.urandom(2), "big")
         self.out_ts = int.from_bytes(os.urandom(4), "big")
         self.out_ssrc = int.from_bytes(os.urandom(4), "big")
 
-        self.buf = bytearray()
-        self.in_speech = False
-        self.silence_ms = 0
+        # качество медиа: входящий поток (потери, jitter), исходящий (опоздания, RTT)
+        self.rx = ReceiverStats(SAMPLE_RATE)
+        self.tx = SenderStats()
+        self.closed = False
+
+        self.segmenter = UtteranceSegmenter(SAMPLE_RATE)
+        self.dtmf = DtmfDetector()
 
         self.greeted = False
+        self.rejected = False
+
+        # очередь на воспроизведение: [payload, отправлено байт, время первого кадра]
+        self.playout = deque()
 
         self.messages = [
             {"role": "system", "content": (
@@ -122,133 +177,468 @@ class Session:
         ]
 
     def payload_to_pcm(self, payload: bytes) -> bytes:
-        if RTP_FORMAT == "ulaw":
-            return audioop.ulaw2lin(payload, 2)
-        # slin/slin16: это уже PCM s16le
-        return payload
+        return MEDIA.payload_to_pcm(payload)
 
     def pcm_to_payload(self, pcm_s16le: bytes) -> tuple[bytes, int]:
         """
         Возвращает (payload_bytes, frame_payload_bytes) для 20ms.
         """
-        if RTP_FORMAT == "ulaw":
-            payload = audioop.lin2ulaw(pcm_s16le, 2)
-            return payload, 160  # 20ms@8k: 160 байт ulaw
-        return pcm_s16le, 320    # 160 samples * 2 bytes
-
-    def send_payload_stream(self, payload: bytes, frame_payload_bytes: int):
-        for i in range(0, len(payload), frame_payload_bytes):
-            chunk = payload[i:i + frame_payload_bytes]
-            if len(chunk) < frame_payload_bytes:
-                if RTP_FORMAT == "ulaw":
-                    chunk += b"\xff" * (frame_payload_bytes - len(chunk))
-                else:
-                    chunk += b"\x00" * (frame_payload_bytes - len(chunk))
-
-            pkt = build_rtp(self.pt, self.out_seq, self.out_ts, self.out_ssrc, chunk)
-            self.sock.sendto(pkt, self.addr)
-
-            self.out_seq = (self.out_seq + 1) & 0xFFFF
-            self.out_ts = (self.out_ts + 160) & 0xFFFFFFFF  # 20ms шаг для 8kHz
-            time.sleep(0.02)
+        return MEDIA.pcm_to_payload(pcm_s16le), MEDIA.frame_bytes
+
+    def play(self, payload: bytes):
+        """
+        Ставит payload в очередь воспроизведения звонка и сразу возвращает управление:
+        кадры отправляет pacer, фразы одного звонка идут подряд в порядке постановки.
+        """
+        if not payload or self.closed:
+            return
+        self.playout.append([payload, 0, None])
+        pacer.schedule(self)
+
+    def send_next_frame(self, deadline: float) -> bool:
+        """
+        Вызывается pacer'ом на дедлайне очередного кадра. Дедлайны идут по абсолютному
+        графику start + n*20ms: отставание от графика (наша задержка, не сеть)
+        попадает в статистику. False — воспроизводить больше нечего.
+        """
+        if self.closed or not self.playout:
+            self.playout.clear()
+            return False
+
+        item = self.playout[0]
+        payload, offset = item[0], item[1]
+        chunk = payload[offset:offset + MEDIA.frame_bytes]
+        if len(chunk) < MEDIA.frame_bytes:
+            chunk += MEDIA.silence_byte * (MEDIA.frame_bytes - len(chunk))
+
+        pkt = build_rtp(self.pt, self.out_seq, self.out_ts, self.out_ssrc, chunk)
+        self.sock.sendto(pkt, self.addr)
+        now = time.monotonic()
+        self.tx.on_sent(len(chunk), self.out_ts, (now - deadline) * 1000, now)
+        if recorder:
+            recorder.push(self.call_tag, "out", chunk, self.rec_encoding)
+
+        self.out_seq = (self.out_seq + 1) & 0xFFFF
+        self.out_ts = (self.out_ts + MEDIA.frame_samples) & 0xFFFFFFFF  # 20ms шаг
+
+        if item[2] is None:
+            item[2] = now
+        item[1] = offset + MEDIA.frame_bytes
+        if item[1] >= len(payload):
+            self.playout.popleft()
+            if self.trace:
+                self.trace.add("send", (now - item[2]) * 1000)
+        return bool(self.playout)
+
+    def rtcp_report(self) -> bytes:
+        """
+        Составной RTCP: SR (если мы уже что-то отправили) или RR + SDES CNAME.
+        """
+        now = time.monotonic()
+        blocks = [self.rx.report_block(self.ssrc_in, now)] if self.rx.started else []
+        if self.tx.packets:
+            report = build_sr(self.out_ssrc, self.tx, SAMPLE_RATE, blocks)
+        else:
+            report = build_rr(self.out_ssrc, blocks)
+        return report + build_sdes_cname(self.out_ssrc, f"media_server@{self.call_tag}")
+
+    def on_rtcp(self, report: dict):
+        if report["type"] == "SR" and report["ssrc"] == self.ssrc_in:
+            self.rx.on_sender_report(report["ntp_msw"], report["ntp_lsw"], time.monotonic())
+        for block in report.get("blocks", ()):
+            if block["ssrc"] == self.out_ssrc:
+                self.tx.on_report_block(block, time.time())
+                if self.tx.rtt_ms is not None:
+                    metrics.observe("rtp.rtt_ms", self.tx.rtt_ms)
+
+    def media_stats(self) -> dict:
+        """
+        Текущая статистика качества медиа (для метрик, итогов звонка и адаптивной логики).
+        """
+        expected = self.rx.expected
+        return {
+            "rx_packets": self.rx.received,
+            "rx_lost": self.rx.lost,
+            "rx_loss_pct": 100.0 * self.rx.lost / expected if expected > 0 else 0.0,
+            "rx_jitter_ms": self.rx.jitter_ms,
+            "tx_packets": self.tx.packets,
+            "tx_late_packets": self.tx.late_packets,
+            "tx_lateness_max_ms": self.tx.lateness_max_ms,
+            "tx_lateness_avg_ms": self.tx.lateness_sum_ms / self.tx.packets if self.tx.packets else 0.0,
+            "remote_loss_pct": 100.0 * self.tx.remote_fraction_lost,
+            "rtt_ms": self.tx.rtt_ms,
+        }
+
+    def close(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        scheduler.cancel(self)
+        if self.rtcp_sock is not None:
+            # последний отчёт и BYE: Asterisk узнаёт о конце потока, а не ждёт таймаута
+            try:
+                self.rtcp_sock.sendto(self.rtcp_report() + build_bye(self.out_ssrc), self.rtcp_addr)
+            except OSError as e:
+                print(f"[media_server] RTCP BYE send error for {self.rtcp_addr}: {e}")
+        if recorder:
+            recorder.end_call(self.call_tag)
+        if self.trace:
+            # спан send последней фразы закрывается уже после её хода
+            self.trace.flush("call end")
+        st = self.media_stats()
+        metrics.inc("rtp.rx_packets", st["rx_packets"])
+        metrics.inc("rtp.rx_lost", max(0, st["rx_lost"]))
+        metrics.inc("rtp.tx_late_packets", st["tx_late_packets"])
+        metrics.observe("rtp.jitter_ms", st["rx_jitter_ms"])
+        metrics.observe("rtp.out_lateness_max_ms", st["tx_lateness_max_ms"])
+        rtt = f"{st['rtt_ms']:.1f}ms" if st["rtt_ms"] is not None else "n/a"
+        print(f"[media_server] call ended ({reason}) {self.addr}: "
+              f"rx={st['rx_packets']} lost={st['rx_lost']} ({st['rx_loss_pct']:.2f}%) "
+              f"jitter={st['rx_jitter_ms']:.1f}ms, tx={st['tx_packets']} late={st['tx_late_packets']} "
+              f"max_late={st['tx_lateness_max_ms']:.1f}ms, remote_loss={st['remote_loss_pct']:.1f}% rtt={rtt}")
 
     def maybe_greet(self):
         if self.greeted:
             return
         self.greeted = True
-        greeting = (
-            "Здравствуйте. Вы позвонили в техническую поддержку компании СКС сервис. "
-            "Опишите, пожалуйста, вашу проблему."
-        )
-        executor.submit(self._tts_and_send, greeting)
+        if not scheduler.submit(self, self.play_prompt, GREETING_PROMPT):
+            print(f"[media_server] overload: dropped greeting for {self.addr}")
 
-    def _tts_and_send(self, text: str):
-        tts_pcm = synthesize_pcm(text)
-        out_payload, frame_payload_bytes = self.pcm_to_payload(tts_pcm)
-        self.send_payload_stream(out_payload, frame_payload_bytes)
+    def play_prompt(self, text: str):
+        self.play(cached_prompt_payload(text))
+
+    def reject(self):
+        """
+        Звонок не принят при перегрузке: проигрываем фразу о занятости из кэша
+        и дальше игнорируем входящее аудио. Очереди нет: фраза сразу встаёт
+        в pacer, как и у любого звонка. В TTS при перегрузке не ходим —
+        если прогрев не удался, звонок отклоняется без фразы.
+        """
+        self.rejected = True
+        payload = _prompt_cache.get(BUSY_PROMPT)
+        if payload is None:
+            metrics.inc("sched.busy_prompt_missing")
+            print(f"[media_server] busy prompt not cached, rejecting {self.addr} without it")
+            return
+        self.play(payload)
+
+    def on_dtmf(self, rtp_ts: int, payload: bytes):
+        """
+        Пакет telephone-event (RFC 4733): в VAD/STT не попадает.
+        """
+        if self.rejected:
+            return
+        digit = self.dtmf.push(rtp_ts, payload)
+        if not digit:
+            return
+        metrics.inc("dtmf.digits")
+        reply = DTMF_ROUTES.get(digit)
+        print(f"[media_server] DTMF {digit} from {self.addr}{' -> route' if reply else ''}")
+        if not reply:
+            return
+
+        # ответ из кэша играет сразу, не дожидаясь идущего хода (STT -> LLM -> TTS) звонка
+        payload = _prompt_cache.get(reply)
+        if payload is not None:
+            metrics.inc("dtmf.routed")
+            self.play(payload)
+            task = (self.remember_dtmf_route, digit, reply)
+        else:
+            # прогрев ещё не дошёл до этой фразы или не удался: синтез — обычным ходом
+            task = (self.play_dtmf_route, digit, reply)
+        if not scheduler.submit(self, *task):
+            print(f"[media_server] overload: dropped DTMF {digit} from {self.addr}")
+
+    def remember_dtmf_route(self, digit: str, reply: str):
+        # в историю, чтобы LLM продолжила диалог с учётом выбора в меню;
+        # через планировщик — чтобы не пересечься с идущим ходом этого звонка
+        self.messages.append({"role": "user", "content": f"Абонент нажал клавишу {digit}."})
+        self.messages.append({"role": "assistant", "content": reply})
+
+    def play_dtmf_route(self, digit: str, reply: str):
+        self.remember_dtmf_route(digit, reply)
+        metrics.inc("dtmf.routed")
+        self.play_prompt(reply)
 
     def feed(self, payload: bytes):
-        if not payload:
+        if not payload or self.rejected:
             return
 
         # как только пошёл RTP от Asterisk — можно слать greeting назад
         self.maybe_greet()
 
+        if recorder:
+            recorder.push(self.call_tag, "in", payload, self.rec_encoding)
+
         pcm = self.payload_to_pcm(payload)
 
-        try:
-            rms = audioop.rms(pcm, 2)
-        except Exception:
-            return
+        utterance = self.segmenter.push(pcm)
+        if utterance:
+            pcm_bytes, frames = utterance
+            if not scheduler.submit(self, process_utterance, self, pcm_bytes, frames):
+                print(f"[media_server] overload: dropped utterance from {self.addr}")
 
-        if rms >= RMS_SPEECH_THRESHOLD:
-            if not self.in_speech:
-                self.in_speech = True
-                self.silence_ms = 0
-            self.buf.extend(pcm)
-        else:
-            if self.in_speech:
-                self.silence_ms += FRAME_MS
-                self.buf.extend(pcm)
 
-                if self.silence_ms >= END_SILENCE_MS:
-                    pcm_bytes = bytes(self.buf)
-                    self.buf.clear()
-                    self.in_speech = False
-                    self.silence_ms = 0
+def synthesize_tts_pcm(text: str) -> bytes:
+    """
+    TTS в частоте TTS_SAMPLE_RATE, приведённый к частоте тракта.
+    """
+    with scheduler.provider("tts"):
+        tts_pcm = synthesize_pcm(text, sample_rate=TTS_SAMPLE_RATE)
+    return resample(tts_pcm, TTS_SAMPLE_RATE, SAMPLE_RATE)
+
 
-                    utter_ms = int((len(pcm_bytes) / 2) / SAMPLE_RATE * 1000)
-                    if utter_ms >= MIN_UTTERANCE_MS:
-                        executor.submit(process_utterance, self, pcm_bytes)
+_prompt_cache = {}
+_prompt_lock = threading.Lock()
 
 
-def process_utterance(sess: Session, pcm_bytes: bytes):
+def cached_prompt_payload(text: str) -> bytes:
+    """
+    Готовый RTP payload фиксированной фразы: синтезируется один раз на процесс.
+    """
+    payload = _prompt_cache.get(text)
+    if payload is not None:
+        return payload
+    with _prompt_lock:
+        payload = _prompt_cache.get(text)
+        if payload is None:
+            payload = MEDIA.pcm_to_payload(synthesize_tts_pcm(text))
+            _prompt_cache[text] = payload
+    return payload
+
+
+def warm_prompts():
+    for text in (GREETING_PROMPT, BUSY_PROMPT, *DTMF_ROUTES.values()):
+        try:
+            cached_prompt_payload(text)
+        except Exception as e:
+            print(f"[media_server] prompt warm-up failed: {e}")
+
+
+def recognize_utterance(pcm_bytes: bytes, frames: list) -> str:
+    """
+    Подготовка высказывания к STT (обрезка тишины, громкость, ресемплинг,
+    компактное кодирование) и распознавание; экономия байт и задержка — в metrics.
+    """
+    stt_pcm = condition_for_stt(pcm_bytes, frames, SAMPLE_RATE)
+    stt_pcm = resample(stt_pcm, SAMPLE_RATE, STT_SAMPLE_RATE)
+    data, audio_format = encode_for_upload(stt_pcm, STT_SAMPLE_RATE)
+
+    # базовая линия — то, что раньше уходило как есть: весь буфер в lpcm на частоте STT
+    raw_bytes = len(pcm_bytes) * STT_SAMPLE_RATE // SAMPLE_RATE
+    metrics.inc("stt.bytes_raw", raw_bytes)
+    metrics.inc("stt.bytes_sent", len(data))
+
+    t0 = time.monotonic()
+    with scheduler.provider("stt"):
+        text = recognize_audio(data, audio_format, sample_rate=STT_SAMPLE_RATE)
+    stt_ms = (time.monotonic() - t0) * 1000
+    metrics.observe(f"stt.latency_ms.{audio_format}", stt_ms)
+
+    trimmed_ms = (len(pcm_bytes) - len(stt_pcm) * SAMPLE_RATE // STT_SAMPLE_RATE) * 1000 // (SAMPLE_RATE * 2)
+    saved = 100.0 * (1 - len(data) / raw_bytes) if raw_bytes else 0.0
+    print(f"[media_server] stt: {raw_bytes} -> {len(data)} bytes {audio_format} (-{saved:.0f}%), "
+          f"trimmed {trimmed_ms}ms, {stt_ms:.0f}ms")
+    return text
+
+
+def process_utterance(sess: Session, pcm_bytes: bytes, frames: list = None):
+    # перед каждым обращением к провайдеру: звонок, закончившийся во время хода,
+    # не должен занимать слоты STT/LLM/TTS ради ответа, который некому слушать
     try:
-        text = recognize_pcm(pcm_bytes, sample_rate=SAMPLE_RATE)
+        if sess.closed:
+            return
+        with span(sess.trace, "stt"):
+            text = recognize_utterance(pcm_bytes, frames or [])
         if not text:
             reply = "Я вас не расслышала. Назовите, пожалуйста, модель оборудования и что именно не работает."
         else:
             sess.messages.append({"role": "user", "content": text})
-            reply = chat(sess.messages) or "Уточните, пожалуйста, модель оборудования и симптомы."
+            if sess.closed:
+                return
+            with scheduler.provider("llm"), span(sess.trace, "llm"):
+                reply = chat(sess.messages)
+            reply = reply or "Уточните, пожалуйста, модель оборудования и симптомы."
             sess.messages.append({"role": "assistant", "content": reply})
 
-        tts_pcm = synthesize_pcm(reply)
-        out_payload, frame_payload_bytes = sess.pcm_to_payload(tts_pcm)
-        sess.send_payload_stream(out_payload, frame_payload_bytes)
+        if sess.closed:
+            return
+        with span(sess.trace, "tts"):
+            tts_pcm = synthesize_tts_pcm(reply)
+        out_payload, _frame_payload_bytes = sess.pcm_to_payload(tts_pcm)
+        # ход заканчивается здесь: воспроизведение идёт в pacer, поток хода свободен для STT/LLM/TTS
+        sess.play(out_payload)
 
     except Exception as e:
         print(f"[media_server] error for {sess.addr}: {e}")
 
+    finally:
+        if sess.trace:
+            sess.trace.flush()
 
-def main():
-    if RTP_FORMAT not in ("ulaw", "slin", "slin16"):
-        raise RuntimeError("RTP_FORMAT must be ulaw or slin/slin16")
 
+def rtcp_loop(rtcp_sock: socket.socket, sessions: dict):
+    """
+    Приём RTCP от Asterisk и периодическая отправка наших SR/RR по всем звонкам.
+    """
+    rtcp_sock.settimeout(0.5)
+    next_report = time.monotonic() + RTCP_INTERVAL_SEC
+    while True:
+        try:
+            pkt, _addr = rtcp_sock.recvfrom(2048)
+        except socket.timeout:
+            pkt = None
+        except OSError as e:
+            print(f"[media_server] RTCP recv error: {e}")
+            pkt = None
+
+        if pkt:
+            by_ssrc = {s.ssrc_in: s for s in list(sessions.values())}
+            for report in parse_rtcp(pkt):
+                if report["type"] == "BYE":
+                    for ssrc in report["ssrcs"]:
+                        if ssrc in by_ssrc:
+                            by_ssrc[ssrc].close("rtcp bye")
+                    continue
+                sess = by_ssrc.get(report["ssrc"])
+                if sess:
+                    sess.on_rtcp(report)
+
+        now = time.monotonic()
+        if now >= next_report:
+            next_report = now + RTCP_INTERVAL_SEC
+            for sess in list(sessions.values()):
+                if sess.closed:
+                    continue
+                try:
+                    rtcp_sock.sendto(sess.rtcp_report(), sess.rtcp_addr)
+                except OSError as e:
+                    print(f"[media_server] RTCP send error for {sess.rtcp_addr}: {e}")
+
+
+def reap_sessions(sessions: dict, now: float):
+    for key, sess in list(sessions.items()):
+        if not sess.closed and now - sess.rx.last_rx_at >= SESSION_IDLE_SEC:
+            sess.close("rtp timeout")
+        if sess.closed:
+            del sessions[key]
+
+
+def drained(sessions: dict, slot, now: float) -> bool:
+    """
+    Дренаж: ждём конца текущих звонков, по DRAIN_TIMEOUT_SEC закрываем оставшиеся.
+    """
+    if not sessions:
+        return True
+    if now - slot.drain_started < DRAIN_TIMEOUT_SEC:
+        return False
+    for sess in list(sessions.values()):
+        sess.close("drain timeout")
+    sessions.clear()
+    return True
+
+
+def main(port: int = RTP_PORT, slot=None):
+    """
+    port — RTP-порт (RTCP на port+1). slot — WorkerSlot, когда процесс запущен
+    супервизором: через него публикуются состояние и метрики, по нему же
+    приходит команда на дренаж.
+    """
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(("192.168.1.2", RTP_PORT))
-
-    print(f"[media_server] RTP listening on 192.168.1.2:{RTP_PORT}, format={RTP_FORMAT}, sr={SAMPLE_RATE}")
+    sock.bind(("192.168.1.2", port))
+    sock.settimeout(1.0)
+
+    print(f"[media_server] RTP listening on 192.168.1.2:{port}, format={RTP_FORMAT}, sr={SAMPLE_RATE}, "
+          f"stt_sr={STT_SAMPLE_RATE}, tts_sr={TTS_SAMPLE_RATE}")
+    if DTMF_ROUTES:
+        print(f"[media_server] DTMF routes (pt={DTMF_PAYLOAD_TYPE}): {', '.join(sorted(DTMF_ROUTES))}")
+    print(f"[media_server] VAD: rms>={RMS_SPEECH_THRESHOLD}, min_utterance={MIN_UTTERANCE_MS}ms, "
+          f"end_silence={END_SILENCE_MS}ms")
+
+    pacer.start()
+
+    if recorder:
+        recorder.start()
+        # Ctrl+C в одиночном режиме до recorder.stop() в конце main не доходит
+        atexit.register(recorder.stop)
+        print(f"[media_server] recording calls to {RECORD_DIR} ({recorder.fmt})")
+
+    # фразы приветствия и отказа синтезируем заранее, чтобы при всплеске не ходить в TTS
+    threading.Thread(target=warm_prompts, name="prompt-warmup", daemon=True).start()
+    if slot is None:
+        metrics.start_reporter(METRICS_LOG_SEC, "[media_server] metrics:")
+        profiler.install("media_server", PROFILE_ADMIN_PORT)
+    else:
+        # метрики сводит супервизор; admin-порт профайлера у каждого воркера свой
+        profiler.install(f"media_server_w{slot.index}", PROFILE_ADMIN_PORT + slot.index if PROFILE_ADMIN_PORT else 0)
+        slot.heartbeat(0)
 
     sessions = {}
 
+    rtcp_sock = None
+    if RTCP_ENABLED:
+        rtcp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtcp_sock.bind(("192.168.1.2", port + 1))
+        threading.Thread(target=rtcp_loop, args=(rtcp_sock, sessions), name="rtcp", daemon=True).start()
+        print(f"[media_server] RTCP on 192.168.1.2:{port + 1}, interval={RTCP_INTERVAL_SEC}s")
+
+    next_reap = time.monotonic() + 1.0
+
     while True:
-        pkt, addr = sock.recvfrom(4096)
+        try:
+            pkt, addr = sock.recvfrom(4096)
+        except socket.timeout:
+            pkt = None
+
+        now = time.monotonic()
+        if now >= next_reap:
+            next_reap = now + 1.0
+            reap_sessions(sessions, now)
+            if slot is not None:
+                slot.heartbeat(len(sessions))
+                if slot.draining and drained(sessions, slot, now):
+                    break
+
+        if pkt is None:
+            continue
+
         parsed = parse_rtp(pkt)
         if not parsed:
             continue
 
-        pt, _seq, _ts, ssrc, payload = parsed
+        pt, seq, ts, ssrc, payload = parsed
         if not payload:
             continue
 
         key = (addr[0], addr[1], ssrc)
         sess = sessions.get(key)
+
+        # telephone-event идёт тем же потоком (SSRC/seq), но отдельным payload type
+        if pt == DTMF_PAYLOAD_TYPE:
+            if sess:
+                sess.rx.update(seq, ts, now, jitter=False)
+                sess.on_dtmf(ts, payload)
+            continue
+
         if not sess:
-            sess = Session(sock=sock, addr=addr, pt=pt, ssrc_in=ssrc)
+            sess = Session(sock=sock, addr=addr, pt=pt, ssrc_in=ssrc, rtcp_sock=rtcp_sock)
             sessions[key] = sess
             print(f"[media_server] new session from {addr}, pt={pt}, ssrc={ssrc}")
+            if slot is not None and slot.draining:
+                print(f"[media_server] draining: rejecting call from {addr}")
+                sess.reject()
+            elif not scheduler.admit():
+                print(f"[media_server] overload: rejecting call from {addr}")
+                sess.reject()
+
+        sess.rx.update(seq, ts, now)
+
+        with span(sess.trace, "feed"):
+            sess.feed(payload)
 
-        sess.feed(payload)
+    if recorder:
+        recorder.stop()
+    print(f"[media_server] worker on port {port} stopped")
 
 
 if __name__ == "__main__":
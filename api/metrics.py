@@ -0,0 +1,118 @@
+import time
+import threading
+
+# границы корзин гистограмм (мс); последняя корзина — всё, что больше
+HIST_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_hists = {}  # name -> [bucket_counts..., count, sum, max]
+
+
+def inc(name: str, n: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def set_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value_ms: float):
+    with _lock:
+        h = _hists.get(name)
+        if h is None:
+            h = [0] * (len(HIST_BUCKETS_MS) + 1) + [0, 0.0, 0.0]
+            _hists[name] = h
+        i = 0
+        while i < len(HIST_BUCKETS_MS) and value_ms > HIST_BUCKETS_MS[i]:
+            i += 1
+        h[i] += 1
+        h[-3] += 1
+        h[-2] += value_ms
+        if value_ms > h[-1]:
+            h[-1] = value_ms
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _hists.clear()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "hists": {k: list(v) for k, v in _hists.items()},
+        }
+
+
+def merge_snapshots(snaps: list[dict]) -> dict:
+    """
+    Сводит снимки нескольких процессов: счётчики, gauge и корзины гистограмм
+    суммируются, максимум берётся по всем.
+    """
+    out = {"counters": {}, "gauges": {}, "hists": {}}
+    for snap in snaps:
+        for k, v in snap.get("counters", {}).items():
+            out["counters"][k] = out["counters"].get(k, 0) + v
+        for k, v in snap.get("gauges", {}).items():
+            out["gauges"][k] = out["gauges"].get(k, 0) + v
+        for k, h in snap.get("hists", {}).items():
+            acc = out["hists"].get(k)
+            if acc is None:
+                out["hists"][k] = list(h)
+                continue
+            for i in range(len(h) - 1):
+                acc[i] += h[i]
+            acc[-1] = max(acc[-1], h[-1])
+    return out
+
+
+def hist_quantile(h: list, q: float) -> float:
+    """
+    Оценка квантиля по корзинам: верхняя граница корзины, в которую он попал,
+    но не больше наблюдавшегося максимума.
+    """
+    count = h[-3]
+    if not count:
+        return 0.0
+    target = q * count
+    acc = 0
+    for i, bound in enumerate(HIST_BUCKETS_MS):
+        acc += h[i]
+        if acc >= target:
+            return min(float(bound), h[-1])
+    return h[-1]
+
+
+def format_snapshot(snap: dict) -> str:
+    parts = [f"{k}={v}" for k, v in sorted(snap["counters"].items())]
+    parts += [f"{k}={v:g}" for k, v in sorted(snap["gauges"].items())]
+    for k, h in sorted(snap["hists"].items()):
+        if h[-3]:
+            parts.append(f"{k}: n={h[-3]} avg={h[-2] / h[-3]:.0f} "
+                         f"p50={hist_quantile(h, 0.5):.0f} p95={hist_quantile(h, 0.95):.0f} max={h[-1]:.0f}")
+    return ", ".join(parts)
+
+
+def start_reporter(interval_sec: float, prefix: str = "[metrics]"):
+    """
+    Фоновый поток, раз в interval_sec печатающий сводку метрик.
+    """
+    if interval_sec <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval_sec)
+            line = format_snapshot(snapshot())
+            if line:
+                print(f"{prefix} {line}")
+
+    threading.Thread(target=loop, name="metrics-reporter", daemon=True).start()
@@ -0,0 +1,76 @@
+import heapq
+import itertools
+import threading
+import time
+
+from api import metrics
+
+
+class PlayoutPacer:
+    """
+    Один поток, который раздаёт исходящие RTP-кадры всех звонков по графику 20ms.
+
+    Воспроизведение длится секунды реального времени, поэтому не занимает ни потоки
+    ходов (они нужны STT/LLM/TTS), ни отдельный поток на звонок: звонок с готовым
+    аудио ставится в кучу дедлайнов, и на каждом дедлайне pacer вызывает
+    stream.send_next_frame(deadline). True — у звонка есть ещё кадры, следующий
+    дедлайн через frame_sec; False — звонок снимается с графика.
+    """
+
+    def __init__(self, frame_sec: float, name: str = "playout"):
+        self.frame_sec = frame_sec
+        self.name = name
+        self.cond = threading.Condition()
+        self.heap = []          # (deadline, порядковый номер, stream)
+        self.scheduled = set()  # звонки, уже стоящие в куче
+        # schedule() пришёл, пока звонок доигрывал последний кадр: не снимать его с графика
+        self.rearm = set()
+        self.order = itertools.count()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, stream):
+        """
+        Ставит звонок на график с ближайшего кадра; для звонка, который уже
+        играет, лишь не даёт снять его с графика после текущего кадра.
+        """
+        with self.cond:
+            if stream in self.scheduled:
+                self.rearm.add(stream)
+                return
+            self.scheduled.add(stream)
+            heapq.heappush(self.heap, (time.monotonic(), next(self.order), stream))
+            metrics.set_gauge("playout.active", len(self.scheduled))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                deadline, _n, stream = self.heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    # новый звонок мог встать раньше текущего дедлайна
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+
+            try:
+                more = stream.send_next_frame(deadline)
+            except Exception as e:
+                print(f"[playout] send error: {e}")
+                more = False
+
+            with self.cond:
+                if stream in self.rearm:
+                    self.rearm.discard(stream)
+                    more = True
+                if more:
+                    heapq.heappush(self.heap, (deadline + self.frame_sec, next(self.order), stream))
+                else:
+                    self.scheduled.discard(stream)
+                    metrics.set_gauge("playout.active", len(self.scheduled))
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+# страховка: забытый профайлер сам выключится
+PROFILE_MAX_SEC = float(os.getenv("PROFILE_MAX_SEC", "120"))
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер всех потоков процесса.
+
+    Раз в PROFILE_INTERVAL_MS снимает стеки через sys._current_frames()
+    и копит их в формате collapsed stacks ("thread;f1;f2;leaf count"),
+    который читают flamegraph.pl, speedscope, inferno и т.п.
+    Пока выключен, не стоит ничего: поток сэмплирования не запущен.
+    """
+
+    def __init__(self, name: str, interval_ms: float = PROFILE_INTERVAL_MS,
+                 out_dir: str = PROFILE_DIR, max_sec: float = PROFILE_MAX_SEC):
+        self.name = name
+        self.interval = interval_ms / 1000.0
+        self.out_dir = out_dir
+        self.max_sec = max_sec
+
+        self.lock = threading.Lock()
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> bool:
+        with self.lock:
+            if self._thread is not None:
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.started_at = time.monotonic()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        print(f"[profiler] {self.name}: started, interval={self.interval * 1000:g}ms")
+        return True
+
+    def stop(self) -> str:
+        """
+        Останавливает сэмплирование и пишет collapsed-файл. Возвращает путь к нему.
+        """
+        with self.lock:
+            thread = self._thread
+            if thread is None:
+                return ""
+            self._thread = None
+            self._stop.set()
+            stacks, samples = self.stacks, self.samples
+        thread.join()
+        path = self._dump(stacks)
+        print(f"[profiler] {self.name}: stopped, {samples} samples -> {path}")
+        return path
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def collapsed(self) -> str:
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def _dump(self, stacks: dict) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"profile_{self.name}_{os.getpid()}_{time.strftime('%Y%m%d_%H%M%S')}.collapsed")
+        with open(path, "w") as f:
+            for stack, count in stacks.items():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _sample(self, own_ident: int):
+        stacks = self.stacks
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            stack = ";".join(reversed(parts))
+            stacks[stack] = stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            with self.lock:
+                self._sample(own)
+            if self.max_sec and time.monotonic() - self.started_at >= self.max_sec:
+                threading.Thread(target=self.stop, daemon=True).start()
+                return
+
+
+def _admin_handler(profiler: SamplingProfiler):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/profile/start":
+                body = "started\n" if profiler.start() else "already running\n"
+            elif self.path == "/profile/stop":
+                path = profiler.stop()
+                body = f"{path}\n" if path else "not running\n"
+            elif self.path == "/profile/collapsed":
+                body = profiler.collapsed()
+            elif self.path == "/profile/status":
+                body = f"running={profiler.running} samples={profiler.samples}\n"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def install(name: str, admin_port: int = 0, sig=getattr(signal, "SIGUSR1", None)) -> SamplingProfiler:
+    """
+    Подключает профайлер к процессу: kill -USR1 <pid> включает/выключает его,
+    при admin_port > 0 поднимается HTTP на 127.0.0.1 (/profile/start|stop|status|collapsed).
+    Вызывать из главного потока.
+    """
+    profiler = SamplingProfiler(name)
+
+    if sig is not None:
+        # из обработчика сигнала не ждём поток профайлера — переключаем в отдельном потоке
+        signal.signal(sig, lambda _signum, _frame: threading.Thread(target=profiler.toggle, daemon=True).start())
+
+    if admin_port:
+        server = ThreadingHTTPServer(("127.0.0.1", admin_port), _admin_handler(profiler))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="profiler-admin", daemon=True).start()
+        print(f"[profiler] {name}: admin endpoint on 127.0.0.1:{admin_port}")
+
+    return profiler
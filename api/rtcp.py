@@ -0,0 +1,268 @@
+import time
+import struct
+
+RTCP_SR = 200
+RTCP_RR = 201
+RTCP_SDES = 202
+RTCP_BYE = 203
+
+NTP_EPOCH_OFFSET = 2208988800  # 1900-01-01 -> 1970-01-01
+
+RTP_SEQ_MOD = 1 << 16
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+
+
+def ntp_now(now: float = None) -> tuple[int, int]:
+    t = (time.time() if now is None else now) + NTP_EPOCH_OFFSET
+    msw = int(t)
+    lsw = int((t - msw) * (1 << 32)) & 0xFFFFFFFF
+    return msw & 0xFFFFFFFF, lsw
+
+
+def ntp_middle32(msw: int, lsw: int) -> int:
+    return ((msw & 0xFFFF) << 16) | (lsw >> 16)
+
+
+class ReceiverStats:
+    """
+    Статистика входящего RTP-потока по RFC 3550 (приложения A.1, A.3, A.8):
+    расширенный номер последовательности, потери, interarrival jitter.
+    """
+
+    def __init__(self, clock_rate: int):
+        self.clock_rate = clock_rate
+        self.started = False
+        self.base_seq = 0
+        self.max_seq = 0
+        self.cycles = 0
+        self.bad_seq = RTP_SEQ_MOD + 1
+        self.received = 0
+        self.expected_prior = 0
+        self.received_prior = 0
+
+        self.transit = None
+        self.jitter = 0.0  # в единицах RTP timestamp
+
+        # последний SR от отправителя: для LSR/DLSR в наших RR
+        self.last_sr_ntp = 0
+        self.last_sr_at = 0.0
+        self.last_rx_at = 0.0
+
+    def _init_seq(self, seq: int):
+        self.base_seq = seq
+        self.max_seq = seq
+        self.bad_seq = RTP_SEQ_MOD + 1
+        self.cycles = 0
+        self.received = 0
+        self.expected_prior = 0
+        self.received_prior = 0
+
+    def update(self, seq: int, rtp_ts: int, arrival: float, jitter: bool = True) -> bool:
+        """
+        arrival — time.monotonic() прихода пакета. False — пакет вне последовательности.
+        jitter=False — учитывать только последовательность (пакеты telephone-event
+        повторяют timestamp начала нажатия и исказили бы jitter).
+        """
+        self.last_rx_at = arrival
+        if not self.started:
+            self._init_seq(seq)
+            self.started = True
+        else:
+            udelta = (seq - self.max_seq) & 0xFFFF
+            if udelta < MAX_DROPOUT:
+                if seq < self.max_seq:
+                    self.cycles += RTP_SEQ_MOD
+                self.max_seq = seq
+            elif udelta <= RTP_SEQ_MOD - MAX_MISORDER:
+                # большой скачок: либо перезапуск потока, либо мусор
+                if seq == self.bad_seq:
+                    self._init_seq(seq)
+                else:
+                    self.bad_seq = (seq + 1) & 0xFFFF
+                    return False
+            # иначе — дубликат или переупорядоченный пакет
+
+        self.received += 1
+        if not jitter:
+            return True
+
+        transit = int(arrival * self.clock_rate) - rtp_ts
+        if self.transit is not None:
+            d = transit - self.transit
+            # разница по модулю 2^32, чтобы пережить переполнение timestamp
+            d = (d + (1 << 31)) % (1 << 32) - (1 << 31)
+            self.jitter += (abs(d) - self.jitter) / 16.0
+        self.transit = transit
+        return True
+
+    @property
+    def extended_max(self) -> int:
+        return self.cycles + self.max_seq
+
+    @property
+    def expected(self) -> int:
+        return self.extended_max - self.base_seq + 1 if self.started else 0
+
+    @property
+    def lost(self) -> int:
+        return self.expected - self.received
+
+    @property
+    def jitter_ms(self) -> float:
+        return self.jitter * 1000.0 / self.clock_rate
+
+    def on_sender_report(self, ntp_msw: int, ntp_lsw: int, now: float):
+        self.last_sr_ntp = ntp_middle32(ntp_msw, ntp_lsw)
+        self.last_sr_at = now
+
+    def report_block(self, ssrc: int, now: float) -> bytes:
+        """
+        Report block (24 байта) для SR/RR; сдвигает интервал для fraction lost.
+        """
+        expected = self.expected
+        expected_interval = expected - self.expected_prior
+        received_interval = self.received - self.received_prior
+        self.expected_prior = expected
+        self.received_prior = self.received
+        lost_interval = expected_interval - received_interval
+        fraction = 0
+        if expected_interval > 0 and lost_interval > 0:
+            fraction = min(255, (lost_interval << 8) // expected_interval)
+
+        lost = max(-0x800000, min(0x7FFFFF, self.lost)) & 0xFFFFFF
+        dlsr = 0
+        if self.last_sr_ntp:
+            dlsr = int((now - self.last_sr_at) * 65536) & 0xFFFFFFFF
+
+        return struct.pack("!IIIIII", ssrc, (fraction << 24) | lost, self.extended_max & 0xFFFFFFFF,
+                           int(self.jitter) & 0xFFFFFFFF, self.last_sr_ntp, dlsr)
+
+
+class SenderStats:
+    """
+    Статистика исходящего потока: счётчики для SR, опоздание пакетов
+    относительно идеального 20ms-графика и RTT по report block от получателя.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.octets = 0
+        self.last_rtp_ts = 0
+        self.last_send_at = 0.0
+        self.last_sr_ntp = 0
+
+        self.late_packets = 0
+        self.lateness_max_ms = 0.0
+        self.lateness_sum_ms = 0.0
+
+        self.rtt_ms = None
+        self.remote_fraction_lost = 0.0
+        self.remote_lost = 0
+        self.remote_jitter = 0
+
+    def on_sent(self, payload_len: int, rtp_ts: int, lateness_ms: float, now: float):
+        self.packets += 1
+        self.octets += payload_len
+        self.last_rtp_ts = rtp_ts
+        self.last_send_at = now
+        self.lateness_sum_ms += lateness_ms
+        if lateness_ms > 1.0:
+            self.late_packets += 1
+        if lateness_ms > self.lateness_max_ms:
+            self.lateness_max_ms = lateness_ms
+
+    def on_report_block(self, block: dict, now_wall: float):
+        self.remote_fraction_lost = block["fraction_lost"] / 256.0
+        self.remote_lost = block["cumulative_lost"]
+        self.remote_jitter = block["jitter"]
+        if block["lsr"]:
+            # RTT = A - LSR - DLSR в единицах 1/65536 с (RFC 3550, 6.4.1)
+            a = ntp_middle32(*ntp_now(now_wall))
+            rtt = (a - block["lsr"] - block["dlsr"]) & 0xFFFFFFFF
+            if rtt < 0x80000000:
+                self.rtt_ms = rtt * 1000.0 / 65536
+
+
+def build_sr(ssrc: int, tx: SenderStats, clock_rate: int, blocks: list[bytes]) -> bytes:
+    now_wall = time.time()
+    msw, lsw = ntp_now(now_wall)
+    # RTP timestamp, соответствующий моменту SR (экстраполяция от последнего пакета)
+    rtp_ts = tx.last_rtp_ts
+    if tx.last_send_at:
+        rtp_ts += int((time.monotonic() - tx.last_send_at) * clock_rate)
+    tx.last_sr_ntp = ntp_middle32(msw, lsw)
+
+    length_words = (28 + 24 * len(blocks)) // 4 - 1
+    hdr = struct.pack("!BBHIIIIII", 0x80 | len(blocks), RTCP_SR, length_words, ssrc,
+                      msw, lsw, rtp_ts & 0xFFFFFFFF, tx.packets & 0xFFFFFFFF, tx.octets & 0xFFFFFFFF)
+    return hdr + b"".join(blocks)
+
+
+def build_rr(ssrc: int, blocks: list[bytes]) -> bytes:
+    length_words = (8 + 24 * len(blocks)) // 4 - 1
+    return struct.pack("!BBHI", 0x80 | len(blocks), RTCP_RR, length_words, ssrc) + b"".join(blocks)
+
+
+def build_sdes_cname(ssrc: int, cname: str) -> bytes:
+    """
+    SDES с CNAME: по RFC 3550 обязателен в каждом составном RTCP-пакете.
+    """
+    text = cname.encode("utf-8")[:255]
+    chunk = struct.pack("!IBB", ssrc, 1, len(text)) + text + b"\x00"
+    chunk += b"\x00" * (-len(chunk) % 4)
+    return struct.pack("!BBH", 0x81, RTCP_SDES, (4 + len(chunk)) // 4 - 1) + chunk
+
+
+def build_bye(ssrc: int) -> bytes:
+    return struct.pack("!BBHI", 0x81, RTCP_BYE, 1, ssrc)
+
+
+def _parse_blocks(data: bytes, off: int, count: int) -> list[dict]:
+    blocks = []
+    for _ in range(count):
+        if off + 24 > len(data):
+            break
+        ssrc, fl, ext_max, jitter, lsr, dlsr = struct.unpack_from("!IIIIII", data, off)
+        lost = fl & 0xFFFFFF
+        if lost & 0x800000:
+            lost -= 0x1000000
+        blocks.append({
+            "ssrc": ssrc, "fraction_lost": fl >> 24, "cumulative_lost": lost,
+            "ext_max_seq": ext_max, "jitter": jitter, "lsr": lsr, "dlsr": dlsr,
+        })
+        off += 24
+    return blocks
+
+
+def parse_rtcp(pkt: bytes) -> list[dict]:
+    """
+    Разбирает составной RTCP-пакет. Возвращает SR/RR/BYE как словари, прочее пропускает.
+    """
+    out = []
+    off = 0
+    while off + 4 <= len(pkt):
+        b0, pt, length_words = struct.unpack_from("!BBH", pkt, off)
+        if b0 >> 6 != 2:
+            break
+        count = b0 & 0x1F
+        end = off + (length_words + 1) * 4
+        if end > len(pkt):
+            break
+
+        if pt == RTCP_SR and end - off >= 28:
+            ssrc, msw, lsw, rtp_ts, packets, octets = struct.unpack_from("!IIIIII", pkt, off + 4)
+            out.append({
+                "type": "SR", "ssrc": ssrc, "ntp_msw": msw, "ntp_lsw": lsw, "rtp_ts": rtp_ts,
+                "packets": packets, "octets": octets, "blocks": _parse_blocks(pkt[:end], off + 28, count),
+            })
+        elif pt == RTCP_RR and end - off >= 8:
+            (ssrc,) = struct.unpack_from("!I", pkt, off + 4)
+            out.append({"type": "RR", "ssrc": ssrc, "blocks": _parse_blocks(pkt[:end], off + 8, count)})
+        elif pt == RTCP_BYE:
+            ssrcs = [struct.unpack_from("!I", pkt, off + 4 + 4 * i)[0]
+                     for i in range(count) if off + 8 + 4 * i <= end]
+            out.append({"type": "BYE", "ssrcs": ssrcs})
+
+        off = end
+    return out
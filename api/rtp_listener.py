@@ -4,13 +4,15 @@ import queue
 import json
 import time
 import os
-import audioop
 import websocket
 
+from api.audio_format import MediaFormat
+
 # ================== CONFIG ==================
 
 RTP_IP = "0.0.0.0"
 RTP_PORT = 4000
+MEDIA = MediaFormat(os.getenv("RTP_FORMAT", "ulaw"))
 
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
@@ -20,7 +22,7 @@ if not YANDEX_API_KEY or not YANDEX_FOLDER_ID:
 
 STT_URL = (
     "wss://stt.api.cloud.yandex.net/speech/v1/stt:recognizeStreaming"
-    "?lang=ru-RU&format=lpcm&sampleRateHertz=8000"
+    f"?lang=ru-RU&format=lpcm&sampleRateHertz={MEDIA.sample_rate}"
 )
 
 # ============================================
@@ -106,7 +108,7 @@ def start_rtp_listener():
             continue
 
         rtp_payload = data[12:]
-        pcm = audioop.ulaw2lin(rtp_payload, 2)
+        pcm = MEDIA.payload_to_pcm(rtp_payload)
         audio_queue.put(pcm)
 
 
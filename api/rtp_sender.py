@@ -3,23 +3,30 @@ import socket
 import struct
 import time
 
+from api.rtcp import SenderStats, build_sr, build_sdes_cname, build_bye
+
 RTP_HEADER_SIZE = 12
 PAYLOAD_TYPE = 96
 SSRC = 12345678
 
 class RTPSender:
-    def __init__(self, host, port, sample_rate=8000):
+    def __init__(self, host, port, sample_rate=8000, rtcp_interval=5.0):
         self.addr = (host, port)
+        self.rtcp_addr = (host, port + 1)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.seq = 0
         self.ts = 0
         self.sample_rate = sample_rate
+        self.stats = SenderStats()
+        self.rtcp_interval = rtcp_interval
+        self.next_sr = 0.0  # первый SR — сразу после первого пакета
 
     def send_pcm(self, pcm: bytes):
-        frame_samples = 160  # 20 ms @ 8kHz
+        frame_samples = self.sample_rate * 20 // 1000  # 20 ms
         frame_size = frame_samples * 2  # s16
 
-        for i in range(0, len(pcm), frame_size):
+        start = time.monotonic()
+        for n, i in enumerate(range(0, len(pcm), frame_size)):
             chunk = pcm[i:i + frame_size]
             header = struct.pack(
                 "!BBHII",
@@ -29,7 +36,41 @@ class RTPSender:
                 self.ts,
                 SSRC
             )
+            deadline = start + n * 0.02
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
             self.sock.sendto(header + chunk, self.addr)
-            self.seq += 1
-            self.ts += frame_samples
-            time.sleep(0.02)
+            now = time.monotonic()
+            self.stats.on_sent(len(chunk), self.ts, (now - deadline) * 1000, now)
+            self.seq = (self.seq + 1) & 0xFFFF
+            self.ts = (self.ts + frame_samples) & 0xFFFFFFFF
+
+            if self.rtcp_interval > 0 and now >= self.next_sr:
+                self.next_sr = now + self.rtcp_interval
+                self.send_sr()
+
+    def _sr(self) -> bytes:
+        # составной пакет по RFC 3550: SR + SDES CNAME
+        return build_sr(SSRC, self.stats, self.sample_rate, []) + build_sdes_cname(SSRC, "rtp_sender")
+
+    def send_sr(self):
+        """
+        RTCP Sender Report на порт port+1 (без report block: входящий поток здесь не принимаем).
+        Вызывается из send_pcm раз в rtcp_interval.
+        """
+        try:
+            self.sock.sendto(self._sr(), self.rtcp_addr)
+        except OSError as e:
+            print(f"[rtp_sender] RTCP send error: {e}")
+
+    def close(self):
+        """
+        Последний SR и BYE, затем закрытие сокета.
+        """
+        if self.stats.packets:
+            try:
+                self.sock.sendto(self._sr() + build_bye(SSRC), self.rtcp_addr)
+            except OSError as e:
+                print(f"[rtp_sender] RTCP BYE send error: {e}")
+        self.sock.close()
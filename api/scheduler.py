@@ -0,0 +1,165 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from api import metrics
+
+load_dotenv()
+
+SCHED_WORKERS = int(os.getenv("SCHED_WORKERS", "4"))
+# сколько ожидающих ходов допустимо, прежде чем перестать принимать новые звонки
+SCHED_ADMIT_DEPTH = int(os.getenv("SCHED_ADMIT_DEPTH", "8"))
+# жёсткий предел очереди: сверх него ходы уже идущих звонков отбрасываются
+SCHED_MAX_QUEUE = int(os.getenv("SCHED_MAX_QUEUE", "16"))
+# сколько ходов одного звонка может ждать, пока выполняется текущий
+SESSION_MAX_PENDING = int(os.getenv("SESSION_MAX_PENDING", "2"))
+
+PROVIDER_LIMITS = {
+    "stt": int(os.getenv("STT_MAX_CONCURRENCY", "4")),
+    "llm": int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    "tts": int(os.getenv("TTS_MAX_CONCURRENCY", "4")),
+}
+
+
+class TurnScheduler:
+    """
+    Планировщик ходов диалога поверх ThreadPoolExecutor.
+
+    - у одного звонка в работе не больше одного хода, остальные ждут в его очереди;
+    - глубина очереди (принятые, но не начатые ходы) ограничена: при SCHED_ADMIT_DEPTH
+      новые звонки не принимаются, при SCHED_MAX_QUEUE отбрасываются и новые ходы;
+    - обращения к STT/LLM/TTS ограничены семафорами по провайдерам;
+    - ходы завершённого звонка (sess.closed) не выполняются, cancel() снимает их с очереди;
+    - время ожидания в очереди и у семафоров пишется в metrics.
+    """
+
+    def __init__(self, workers: int = SCHED_WORKERS, admit_depth: int = SCHED_ADMIT_DEPTH,
+                 max_queue: int = SCHED_MAX_QUEUE, session_max_pending: int = SESSION_MAX_PENDING,
+                 provider_limits: dict = None):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="turn")
+        self.admit_depth = admit_depth
+        self.max_queue = max_queue
+        self.session_max_pending = session_max_pending
+
+        self.lock = threading.Lock()
+        self.depth = 0
+        self.busy = set()    # сессии, у которых ход в работе
+        self.pending = {}    # сессия -> deque[(enqueued_ts, fn, args)]
+
+        self.limits = dict(provider_limits or PROVIDER_LIMITS)
+        self.providers = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+
+    def split(self, processes: int):
+        """
+        Доля одного из processes воркеров супервизора: настройки планировщика и
+        лимиты провайдеров задают общий бюджет на все процессы, каждому воркеру
+        достаётся total // processes (не меньше 1). Вызывается до первого submit().
+        """
+        if processes <= 1:
+            return
+
+        def share(name: str, total: int) -> int:
+            if total < processes:
+                print(f"[scheduler] {name}={total} is below {processes} workers: "
+                      f"using 1 per worker, {processes} in total")
+            return max(1, total // processes)
+
+        self.executor.shutdown(wait=False)
+        self.workers = share("SCHED_WORKERS", self.workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="turn")
+        self.admit_depth = share("SCHED_ADMIT_DEPTH", self.admit_depth)
+        self.max_queue = share("SCHED_MAX_QUEUE", self.max_queue)
+        self.limits = {name: share(f"{name.upper()}_MAX_CONCURRENCY", n) for name, n in self.limits.items()}
+        self.providers = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+
+    def admit(self) -> bool:
+        """
+        Решение о приёме нового звонка по текущей глубине очереди.
+        """
+        with self.lock:
+            ok = self.depth < self.admit_depth
+        if not ok:
+            metrics.inc("sched.calls_rejected")
+        return ok
+
+    def submit(self, sess, fn, *args) -> bool:
+        """
+        Ставит ход fn(*args) звонка sess. False — ход отброшен из-за перегрузки.
+        """
+        item = (time.monotonic(), fn, args)
+        with self.lock:
+            if self.depth >= self.max_queue:
+                metrics.inc("sched.turns_shed")
+                return False
+
+            if sess in self.busy:
+                q = self.pending.setdefault(sess, deque())
+                if len(q) >= self.session_max_pending:
+                    q.popleft()
+                    self.depth -= 1
+                    metrics.inc("sched.turns_superseded")
+                q.append(item)
+            else:
+                self.busy.add(sess)
+                self.executor.submit(self._run, sess, item)
+
+            self.depth += 1
+            metrics.set_gauge("sched.depth", self.depth)
+        return True
+
+    def cancel(self, sess):
+        """
+        Звонок завершён: его ожидающие ходы снимаются с очереди и больше не
+        занимают ни глубину очереди (admit), ни провайдеров.
+        """
+        with self.lock:
+            q = self.pending.pop(sess, None)
+            if q:
+                self.depth -= len(q)
+                metrics.inc("sched.turns_cancelled", len(q))
+                metrics.set_gauge("sched.depth", self.depth)
+
+    def _run(self, sess, item):
+        enqueued, fn, args = item
+        while True:
+            with self.lock:
+                self.depth -= 1
+                metrics.set_gauge("sched.depth", self.depth)
+            metrics.observe("sched.queue_wait_ms", (time.monotonic() - enqueued) * 1000)
+
+            # звонок мог закончиться, пока ход ждал в очереди
+            if getattr(sess, "closed", False):
+                metrics.inc("sched.turns_cancelled")
+            else:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"[scheduler] turn error: {e}")
+
+            # следующий ход того же звонка выполняем в этом же потоке
+            with self.lock:
+                q = self.pending.get(sess)
+                if not q:
+                    self.pending.pop(sess, None)
+                    self.busy.discard(sess)
+                    return
+                enqueued, fn, args = q.popleft()
+
+    @contextmanager
+    def provider(self, name: str):
+        """
+        with scheduler.provider("stt"): ... — ограничение параллелизма провайдера.
+        """
+        sem = self.providers[name]
+        t0 = time.monotonic()
+        sem.acquire()
+        metrics.observe(f"sched.{name}_wait_ms", (time.monotonic() - t0) * 1000)
+        try:
+            yield
+        finally:
+            sem.release()
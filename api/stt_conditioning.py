@@ -0,0 +1,109 @@
+import os
+import shutil
+import audioop
+import subprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STT_TRIM = os.getenv("STT_TRIM", "1") == "1"
+# сколько тишины оставить вокруг речи, чтобы не срезать начало/конец слов
+STT_TRIM_PAD_MS = int(os.getenv("STT_TRIM_PAD_MS", "200"))
+# короче — считается щелчком/шумом, а не началом речи
+STT_MIN_VOICED_RUN_MS = int(os.getenv("STT_MIN_VOICED_RUN_MS", "60"))
+
+# нормализация громкости: 0 — выключено, иначе целевой пик (из 32767)
+STT_NORMALIZE_PEAK = int(os.getenv("STT_NORMALIZE_PEAK", "0"))
+STT_MAX_GAIN = float(os.getenv("STT_MAX_GAIN", "4"))
+
+# lpcm | oggopus (Yandex STT принимает оба); oggopus кодируется через ffmpeg
+STT_UPLOAD_FORMAT = (os.getenv("STT_UPLOAD_FORMAT", "lpcm") or "lpcm").strip().lower()
+STT_OPUS_BITRATE = os.getenv("STT_OPUS_BITRATE", "24k")
+
+_ffmpeg = shutil.which("ffmpeg")
+_warned = False
+
+
+def trim_utterance(pcm_s16le: bytes, frames: list[tuple[int, bool]], sample_rate: int,
+                   pad_ms: int = STT_TRIM_PAD_MS, min_run_ms: int = STT_MIN_VOICED_RUN_MS) -> bytes:
+    """
+    Обрезает тишину/шум по решениям VAD для каждого кадра.
+    frames — [(длина PCM кадра в байтах, речь ли)] в порядке следования в pcm_s16le.
+    Начало — первая серия речевых кадров не короче min_run_ms, конец — последний речевой кадр;
+    с каждой стороны оставляется pad_ms.
+    """
+    bytes_per_ms = sample_rate * 2 // 1000
+
+    start = end = None
+    run_start = run_bytes = 0
+    off = 0
+    for length, voiced in frames:
+        if voiced:
+            if run_bytes == 0:
+                run_start = off
+            run_bytes += length
+            if start is None and run_bytes >= min_run_ms * bytes_per_ms:
+                start = run_start
+            end = off + length
+        else:
+            run_bytes = 0
+        off += length
+
+    if start is None or end is None:
+        return pcm_s16le
+
+    pad = pad_ms * bytes_per_ms
+    return pcm_s16le[max(0, start - pad):min(len(pcm_s16le), end + pad)]
+
+
+def normalize_gain(pcm_s16le: bytes, target_peak: int = STT_NORMALIZE_PEAK, max_gain: float = STT_MAX_GAIN) -> bytes:
+    if not target_peak or not pcm_s16le:
+        return pcm_s16le
+    peak = audioop.max(pcm_s16le, 2)
+    if not peak:
+        return pcm_s16le
+    gain = min(max_gain, target_peak / peak)
+    if 0.95 <= gain <= 1.05:
+        return pcm_s16le
+    return audioop.mul(pcm_s16le, 2, gain)
+
+
+def encode_for_upload(pcm_s16le: bytes, sample_rate: int, fmt: str = STT_UPLOAD_FORMAT) -> tuple[bytes, str]:
+    """
+    Возвращает (данные, формат для Yandex STT). Если компактное кодирование
+    недоступно или упало — отдаём исходный lpcm.
+    """
+    global _warned
+
+    if fmt != "oggopus":
+        return pcm_s16le, "lpcm"
+
+    if not _ffmpeg:
+        if not _warned:
+            _warned = True
+            print("[stt] ffmpeg not found, STT_UPLOAD_FORMAT=oggopus falls back to lpcm")
+        return pcm_s16le, "lpcm"
+
+    try:
+        r = subprocess.run(
+            [_ffmpeg, "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "-",
+             "-c:a", "libopus", "-b:a", STT_OPUS_BITRATE, "-application", "voip", "-f", "ogg", "-"],
+            input=pcm_s16le, capture_output=True, timeout=10,
+        )
+    except Exception as e:
+        print(f"[stt] opus encode failed: {e}")
+        return pcm_s16le, "lpcm"
+
+    if r.returncode != 0 or not r.stdout:
+        print(f"[stt] opus encode failed: {r.stderr[:200]!r}")
+        return pcm_s16le, "lpcm"
+    return r.stdout, "oggopus"
+
+
+def condition_for_stt(pcm_s16le: bytes, frames: list[tuple[int, bool]], sample_rate: int) -> bytes:
+    """
+    Обрезка по VAD и (опционально) нормализация громкости. Частота не меняется.
+    """
+    if STT_TRIM and frames:
+        pcm_s16le = trim_utterance(pcm_s16le, frames, sample_rate)
+    return normalize_gain(pcm_s16le)
@@ -0,0 +1,329 @@
+"""
+Супервизор media-воркеров: python -m api.supervisor
+
+Запускает MEDIA_WORKERS процессов media_server (по умолчанию — по числу ядер),
+каждый со своей парой портов RTP/RTCP: RTP_PORT + 2*i и RTP_PORT + 2*i + 1.
+Упавший воркер перезапускается. SIGHUP — поочерёдный перезапуск с дренажом
+(воркер перестаёт принимать звонки и выходит, когда текущие закончатся),
+SIGTERM/SIGINT — дренаж всех и выход, SIGUSR1 — переключение профайлера во всех
+воркерах (pid воркера — профайлер только в нём).
+
+Состояние воркеров и их метрики лежат в сегменте shared memory (MEDIA_SHM_NAME):
+воркер раз в секунду публикует свой снимок метрик в свой слот, супервизор сводит
+их в общую картину, ari_handler по нему выбирает порт для нового звонка.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import struct
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from dotenv import load_dotenv
+
+from api import metrics
+
+load_dotenv()
+
+RTP_PORT = int(os.getenv("RTP_PORT", os.getenv("RTP_IN_PORT", "4000")))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "0") or "0") or (os.cpu_count() or 1)
+MEDIA_SHM_NAME = os.getenv("MEDIA_SHM_NAME", "zzz_ai_media")
+MEDIA_SHM_SLOT_BYTES = int(os.getenv("MEDIA_SHM_SLOT_BYTES", "65536"))
+MEDIA_PIN_CPU = os.getenv("MEDIA_PIN_CPU", "1") == "1"
+DRAIN_TIMEOUT_SEC = float(os.getenv("DRAIN_TIMEOUT_SEC", "300"))
+METRICS_LOG_SEC = float(os.getenv("METRICS_LOG_SEC", "60"))
+
+STATE_DOWN = 0
+STATE_ACCEPTING = 1
+STATE_DRAINING = 2
+STATE_NAMES = {STATE_DOWN: "down", STATE_ACCEPTING: "accepting", STATE_DRAINING: "draining"}
+
+SHM_MAGIC = b"ZMW1"
+SHM_HEADER = struct.Struct("<4sII")          # magic, число слотов, размер слота
+# seqlock-версия, pid, порт, состояние, звонков, heartbeat (time.time()), длина JSON метрик
+SLOT_HEADER = struct.Struct("<QIIIIdI")
+
+
+def worker_port(index: int) -> int:
+    return RTP_PORT + 2 * index
+
+
+class WorkerSlot:
+    """
+    Слот одного воркера в shared memory. Пишет только воркер (кроме
+    отметки STATE_DOWN супервизором после его смерти); читатели сверяют
+    seqlock-версию до и после копирования и повторяют при несовпадении.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, index: int, slot_bytes: int):
+        self.buf = shm.buf
+        self.index = index
+        self.offset = SHM_HEADER.size + index * slot_bytes
+        self.capacity = slot_bytes - SLOT_HEADER.size
+        self.draining = False
+        self.drain_started = 0.0
+        self._version = 0
+        self._warned = False
+
+    def start_drain(self):
+        if not self.draining:
+            self.draining = True
+            self.drain_started = time.monotonic()
+
+    def write(self, pid: int, port: int, state: int, sessions: int, payload: bytes = b""):
+        if len(payload) > self.capacity:
+            if not self._warned:
+                self._warned = True
+                print(f"[supervisor] worker {self.index}: metrics snapshot exceeds slot, not published")
+            payload = b""
+        # нечётная версия: идёт запись. "| 1", а не "+ 1": если прежний писатель умер
+        # посреди записи (SIGKILL по таймауту дренажа, падение), версия осталась нечётной,
+        # и "+ 1" навсегда оставил бы слот нечитаемым
+        self._version = SLOT_HEADER.unpack_from(self.buf, self.offset)[0] | 1
+        struct.pack_into("<Q", self.buf, self.offset, self._version)
+        self.buf[self.offset + SLOT_HEADER.size:self.offset + SLOT_HEADER.size + len(payload)] = payload
+        SLOT_HEADER.pack_into(self.buf, self.offset, self._version + 1, pid, port, state, sessions,
+                              time.time(), len(payload))
+
+    def heartbeat(self, sessions: int):
+        """
+        Вызывается из цикла media_server раз в секунду: состояние + снимок метрик.
+        """
+        state = STATE_DRAINING if self.draining else STATE_ACCEPTING
+        payload = json.dumps(metrics.snapshot(), separators=(",", ":")).encode("utf-8")
+        self.write(os.getpid(), worker_port(self.index), state, sessions, payload)
+
+
+def read_slot(buf, index: int, slot_bytes: int, with_metrics: bool = True):
+    offset = SHM_HEADER.size + index * slot_bytes
+    for _ in range(10):
+        v1 = struct.unpack_from("<Q", buf, offset)[0]
+        if v1 & 1:
+            time.sleep(0.0005)
+            continue
+        _v, pid, port, state, sessions, heartbeat, length = SLOT_HEADER.unpack_from(buf, offset)
+        payload = bytes(buf[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length]) if with_metrics else b""
+        if struct.unpack_from("<Q", buf, offset)[0] == v1:
+            snap = json.loads(payload) if payload else None
+            return {"index": index, "pid": pid, "port": port, "state": state, "sessions": sessions,
+                    "heartbeat": heartbeat, "metrics": snap}
+    return None
+
+
+def read_worker_states(shm: shared_memory.SharedMemory, with_metrics: bool = False) -> list[dict]:
+    magic, count, slot_bytes = SHM_HEADER.unpack_from(shm.buf, 0)
+    if magic != SHM_MAGIC:
+        return []
+    states = []
+    for i in range(count):
+        st = read_slot(shm.buf, i, slot_bytes, with_metrics)
+        if st:
+            states.append(st)
+    return states
+
+
+def attach(name: str = MEDIA_SHM_NAME):
+    """
+    Подключение к сегменту из стороннего процесса (ari_handler). None — супервизор не запущен.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+    try:
+        # иначе resource_tracker этого процесса удалит чужой сегмент при выходе
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _worker_main(index: int, slot: WorkerSlot, workers: int):
+    # Ctrl+C обрабатывает супервизор; SIGTERM — сигнал к дренажу
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # обработчик супервизора (пересылка SIGUSR1) не наследуем; свой ставит profiler.install
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: slot.start_drain())
+
+    if MEDIA_PIN_CPU and hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+
+    # унаследованные от супервизора значения не должны попасть в сводку дважды
+    metrics.reset()
+
+    from api import media_server
+    # лимиты планировщика и провайдеров — общие на все воркеры, у каждого своя доля
+    media_server.scheduler.split(workers)
+    media_server.main(port=worker_port(index), slot=slot)
+
+
+class Supervisor:
+    def __init__(self, workers: int = MEDIA_WORKERS, shm_name: str = MEDIA_SHM_NAME,
+                 slot_bytes: int = MEDIA_SHM_SLOT_BYTES):
+        self.workers = workers
+        self.slot_bytes = slot_bytes
+        self.ctx = mp.get_context("fork")
+
+        try:
+            # сегмент от упавшего супервизора
+            stale = shared_memory.SharedMemory(name=shm_name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=shm_name, create=True,
+                                              size=SHM_HEADER.size + workers * slot_bytes)
+        self.shm.buf[:SHM_HEADER.size + workers * slot_bytes] = bytes(SHM_HEADER.size + workers * slot_bytes)
+        SHM_HEADER.pack_into(self.shm.buf, 0, SHM_MAGIC, workers, slot_bytes)
+
+        self.slots = [WorkerSlot(self.shm, i, slot_bytes) for i in range(workers)]
+        self.procs = [None] * workers
+        self.started_at = [0.0] * workers
+        self.backoff = [1.0] * workers
+        # счётчики и гистограммы завершившихся воркеров, сведённые в один снимок;
+        # gauge мёртвого воркера (глубина очереди и т.п.) в сводку не попадают
+        self.retired = metrics.merge_snapshots([])
+        self.draining = {}  # индекс -> срок, после которого SIGKILL
+        self.reload_queue = []
+
+        self.stop_requested = False
+
+    def spawn(self, index: int):
+        proc = self.ctx.Process(target=_worker_main, args=(index, self.slots[index], self.workers),
+                                name=f"media-worker-{index}", daemon=False)
+        proc.start()
+        self.procs[index] = proc
+        self.started_at[index] = time.monotonic()
+        print(f"[supervisor] worker {index} pid={proc.pid} port={worker_port(index)}")
+
+    def _retire(self, index: int, proc):
+        st = read_slot(self.shm.buf, index, self.slot_bytes)
+        if st and st["metrics"] and st["pid"] == proc.pid:
+            final = dict(st["metrics"], gauges={})
+            self.retired = metrics.merge_snapshots([self.retired, final])
+        self.slots[index].write(0, worker_port(index), STATE_DOWN, 0)
+
+    def start_drain(self, index: int):
+        """
+        SIGTERM воркеру: он перестаёт принимать звонки и выходит, когда текущие закончатся.
+        Не дождались за DRAIN_TIMEOUT_SEC (+запас) — SIGKILL в check_workers.
+        """
+        proc = self.procs[index]
+        if proc is None or index in self.draining:
+            return
+        print(f"[supervisor] draining worker {index} pid={proc.pid}")
+        proc.terminate()
+        self.draining[index] = time.monotonic() + DRAIN_TIMEOUT_SEC + 10
+
+    def check_workers(self):
+        now = time.monotonic()
+        for i, proc in enumerate(self.procs):
+            if proc is None:
+                continue
+            if proc.is_alive():
+                if i in self.draining and now >= self.draining[i]:
+                    print(f"[supervisor] worker {i} did not drain in time, killing")
+                    proc.kill()
+                continue
+
+            proc.join()
+            self._retire(i, proc)
+            self.procs[i] = None
+            if self.draining.pop(i, None) is not None:
+                # плановый перезапуск: новый воркер сразу
+                print(f"[supervisor] worker {i} drained")
+                self.started_at[i] = now
+                continue
+
+            print(f"[supervisor] worker {i} pid={proc.pid} exited with {proc.exitcode}")
+            metrics.inc("supervisor.worker_restarts")
+            # быстро падающий воркер перезапускаем с растущей паузой
+            if now - self.started_at[i] < 10:
+                self.backoff[i] = min(self.backoff[i] * 2, 60.0)
+            else:
+                self.backoff[i] = 1.0
+            self.started_at[i] = now + self.backoff[i]
+
+        if self.stop_requested:
+            return
+
+        for i, proc in enumerate(self.procs):
+            if proc is None and now >= self.started_at[i]:
+                self.spawn(i)
+
+        # поочерёдный перезапуск: следующий воркер — когда предыдущий уже заменён
+        if self.reload_queue and not self.draining:
+            self.start_drain(self.reload_queue.pop(0))
+
+    def merged_metrics(self) -> dict:
+        states = read_worker_states(self.shm, with_metrics=True)
+        snaps = [st["metrics"] for st in states if st["metrics"] and st["state"] != STATE_DOWN]
+        return metrics.merge_snapshots([self.retired] + snaps + [metrics.snapshot()])
+
+    def report(self):
+        states = read_worker_states(self.shm)
+        workers = ", ".join(f"{st['index']}:{STATE_NAMES.get(st['state'], '?')}/{st['sessions']}" for st in states)
+        print(f"[supervisor] workers [{workers}]")
+        line = metrics.format_snapshot(self.merged_metrics())
+        if line:
+            print(f"[supervisor] metrics: {line}")
+
+    def request_reload(self):
+        print("[supervisor] reload: restarting workers one by one")
+        self.reload_queue = [i for i in range(self.workers) if i not in self.reload_queue] + self.reload_queue
+
+    def forward_signal(self, signum: int):
+        """
+        SIGUSR1 супервизору — переключение профайлера во всех живых воркерах
+        (у самого супервизора профайлера нет, а действие по умолчанию убило бы его).
+        """
+        for proc in self.procs:
+            if proc is not None and proc.is_alive():
+                try:
+                    os.kill(proc.pid, signum)
+                except ProcessLookupError:
+                    pass
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda *_: self.request_reload())
+        signal.signal(signal.SIGUSR1, lambda signum, _frame: self.forward_signal(signum))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "stop_requested", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "stop_requested", True))
+
+        print(f"[supervisor] starting {self.workers} media workers, ports {worker_port(0)}..{worker_port(self.workers - 1) + 1}")
+        for i in range(self.workers):
+            self.spawn(i)
+
+        next_report = time.monotonic() + METRICS_LOG_SEC
+        try:
+            while not self.stop_requested:
+                time.sleep(0.5)
+                self.check_workers()
+                if METRICS_LOG_SEC > 0 and time.monotonic() >= next_report:
+                    next_report = time.monotonic() + METRICS_LOG_SEC
+                    self.report()
+        finally:
+            print("[supervisor] stopping: draining all workers")
+            self.stop_requested = True
+            self.reload_queue = []
+            for i in range(self.workers):
+                self.start_drain(i)
+            while any(p is not None for p in self.procs):
+                time.sleep(0.5)
+                self.check_workers()
+            self.report()
+            self.shm.close()
+            self.shm.unlink()
+
+
+def main():
+    Supervisor().run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import os
+import random
+import time
+import threading
+from dotenv import load_dotenv
+
+from api import metrics
+
+load_dotenv()
+
+# доля звонков, для которых пишутся спаны (0 — выключено, 1 — все)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+# спаны на каждый RTP-пакет длятся микросекунды: в гистограмму они идут в мкс
+# (span.<имя>_us), иначе всё попадает в первую корзину HIST_BUCKETS_MS
+MICRO_SPANS = ("feed",)
+
+
+class CallTrace:
+    """
+    Спаны одного звонка. Длительности копятся агрегатами по имени
+    (count/total/max), чтобы частые спаны вроде feed не росли в памяти;
+    flush() печатает накопленное одной строкой и отправляет в metrics.
+    add() зовут и RTP-поток (feed), и поток хода (flush), поэтому под блокировкой.
+    """
+
+    def __init__(self, call_tag: str):
+        self.call_tag = call_tag
+        self.spans = {}  # name -> [count, total_ms, max_ms]
+        self.lock = threading.Lock()
+
+    def add(self, name: str, ms: float):
+        with self.lock:
+            s = self.spans.get(name)
+            if s is None:
+                self.spans[name] = [1, ms, ms]
+                return
+            s[0] += 1
+            s[1] += ms
+            if ms > s[2]:
+                s[2] = ms
+
+    def span(self, name: str) -> "Span":
+        return Span(self, name)
+
+    def flush(self, label: str = "turn"):
+        with self.lock:
+            spans, self.spans = self.spans, {}
+        if not spans:
+            return
+        parts = []
+        for name, (count, total, peak) in spans.items():
+            if name in MICRO_SPANS:
+                metrics.observe(f"span.{name}_us", 1000 * total / count)
+            else:
+                metrics.observe(f"span.{name}_ms", total / count)
+            if count == 1:
+                parts.append(f"{name}={total:.1f}ms")
+            else:
+                parts.append(f"{name}=n{count}/avg{total / count:.2f}/max{peak:.2f}ms")
+        print(f"[trace] {self.call_tag} {label}: " + " ".join(parts))
+
+
+class Span:
+    __slots__ = ("trace", "name", "t0")
+
+    def __init__(self, trace: CallTrace, name: str):
+        self.trace = trace
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, (time.perf_counter() - self.t0) * 1000)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def start_call(call_tag: str, sample_rate: float = TRACE_SAMPLE_RATE):
+    """
+    CallTrace для звонка, попавшего в выборку, иначе None.
+    """
+    if sample_rate > 0 and random.random() < sample_rate:
+        return CallTrace(call_tag)
+    return None
+
+
+def span(trace, name: str):
+    """
+    with span(sess.trace, "stt"): ... — без трассировки возвращает общий пустой контекст.
+    """
+    return trace.span(name) if trace is not None else NULL_SPAN
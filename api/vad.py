@@ -0,0 +1,73 @@
+import os
+import audioop
+from dotenv import load_dotenv
+
+from api.audio_format import FRAME_MS
+
+load_dotenv()
+
+RMS_SPEECH_THRESHOLD = int(os.getenv("RMS_SPEECH_THRESHOLD", "200"))
+MIN_UTTERANCE_MS = int(os.getenv("MIN_UTTERANCE_MS", "800"))
+END_SILENCE_MS = int(os.getenv("END_SILENCE_MS", "700"))
+
+
+class UtteranceSegmenter:
+    """
+    Энергетический VAD и нарезка на высказывания — логика Session.feed без сети.
+
+    Кадр с RMS >= threshold — речь. После начала речи буферизуются все кадры;
+    тишина внутри высказывания суммируется (не сбрасывается при возобновлении речи),
+    и как только её набирается end_silence_ms, высказывание закрывается.
+    Короче min_utterance_ms — отбрасывается.
+    """
+
+    def __init__(self, sample_rate: int, threshold: int = RMS_SPEECH_THRESHOLD,
+                 min_utterance_ms: int = MIN_UTTERANCE_MS, end_silence_ms: int = END_SILENCE_MS):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.min_utterance_ms = min_utterance_ms
+        self.end_silence_ms = end_silence_ms
+
+        self.buf = bytearray()
+        self.frames = []  # решения VAD по кадрам буфера: (байт PCM, речь ли)
+        self.in_speech = False
+        self.silence_ms = 0
+
+    def push(self, pcm: bytes):
+        """
+        Кадр PCM s16le. Возвращает (pcm_bytes, frames) закрытого высказывания или None.
+        """
+        try:
+            rms = audioop.rms(pcm, 2)
+        except Exception:
+            return None
+
+        if rms >= self.threshold:
+            if not self.in_speech:
+                self.in_speech = True
+                self.silence_ms = 0
+            self.buf.extend(pcm)
+            self.frames.append((len(pcm), True))
+            return None
+
+        if not self.in_speech:
+            return None
+
+        self.silence_ms += FRAME_MS
+        self.buf.extend(pcm)
+        self.frames.append((len(pcm), False))
+
+        if self.silence_ms < self.end_silence_ms:
+            return None
+
+        pcm_bytes = bytes(self.buf)
+        frames = self.frames
+        self.buf.clear()
+        self.frames = []
+        self.in_speech = False
+        self.silence_ms = 0
+
+        utter_ms = int((len(pcm_bytes) / 2) / self.sample_rate * 1000)
+        if utter_ms < self.min_utterance_ms:
+            return None
+        return pcm_bytes, frames
@@ -0,0 +1,296 @@
+"""
+Офлайн-оценка VAD/эндпойнтинга на записанных звонках.
+
+Прогоняет каталог записей (WAV PCM16 / WAV μ-law / raw μ-law / raw s16le) через ту же
+логику нарезки, что и Session.feed (api.vad.UtteranceSegmenter), без сети.
+Файлы обрабатываются параллельно по процессам, сетка параметров внутри файла
+считается векторно (numpy): одно состояние автомата на каждую комбинацию параметров.
+
+Разметка (необязательно): рядом с аудио файл <имя>.txt в формате меток Audacity —
+строки "start_sec<TAB>end_sec[<TAB>текст]" с интервалами речи.
+
+Пример:
+    python -m api.vad_eval /var/lib/zzz-ai/recordings --glob "*_in_*.wav" \\
+        --threshold 150,200,300 --min-utterance 600,800 --end-silence 500,700,900
+"""
+import os
+import sys
+import glob
+import struct
+import audioop
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from api.audio_format import FRAME_MS
+from api.vad import UtteranceSegmenter, RMS_SPEECH_THRESHOLD, MIN_UTTERANCE_MS, END_SILENCE_MS
+
+ULAW_EXTS = (".ul", ".ulaw", ".mulaw", ".u8")
+SLIN_EXTS = (".slin", ".sln", ".s16")
+
+
+def read_audio(path: str, raw_format: str = "ulaw", raw_rate: int = 8000) -> tuple[bytes, int]:
+    """
+    Возвращает (PCM s16le mono, частота).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if ext == ".wav":
+        return _read_wav(data, path)
+    if ext in ULAW_EXTS or (ext == ".raw" and raw_format == "ulaw"):
+        return audioop.ulaw2lin(data, 2), raw_rate
+    if ext in SLIN_EXTS or ext == ".raw":
+        return data[:len(data) & ~1], raw_rate
+    raise ValueError(f"unsupported audio file: {path}")
+
+
+def _read_wav(data: bytes, path: str) -> tuple[bytes, int]:
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError(f"not a WAV file: {path}")
+    off = 12
+    fmt = None
+    while off + 8 <= len(data):
+        cid, size = struct.unpack_from("<4sI", data, off)
+        body = data[off + 8: off + 8 + size]
+        if cid == b"fmt ":
+            fmt = struct.unpack_from("<HHIIHH", body)
+        elif cid == b"data" and fmt:
+            tag, channels, rate, _byte_rate, _align, bits = fmt
+            if channels != 1:
+                raise ValueError(f"only mono WAV is supported: {path}")
+            if tag == 7 and bits == 8:
+                return audioop.ulaw2lin(body, 2), rate
+            if tag == 1 and bits == 16:
+                return body[:len(body) & ~1], rate
+            raise ValueError(f"unsupported WAV encoding (tag={tag}, bits={bits}): {path}")
+        off += 8 + size + (size & 1)
+    raise ValueError(f"WAV without fmt/data: {path}")
+
+
+def read_labels(audio_path: str) -> list[tuple[float, float]] | None:
+    path = os.path.splitext(audio_path)[0] + ".txt"
+    if not os.path.exists(path):
+        return None
+    segments = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.replace(",", ".").split()
+            if len(parts) >= 2:
+                segments.append((float(parts[0]), float(parts[1])))
+    return segments
+
+
+def frame_rms(pcm: bytes, sample_rate: int) -> np.ndarray:
+    """
+    RMS 20ms-кадров, совпадающий с audioop.rms (целая часть).
+    """
+    n = sample_rate * FRAME_MS // 1000
+    x = np.frombuffer(pcm, dtype="<i2")
+    x = x[:len(x) // n * n].astype(np.float64).reshape(-1, n)
+    return np.floor(np.sqrt((x * x).mean(axis=1)))
+
+
+def sweep(rms: np.ndarray, sample_rate: int, thresholds: np.ndarray, min_utt: np.ndarray,
+          end_sil: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """
+    Автомат UtteranceSegmenter для P комбинаций параметров сразу.
+    Возвращает [(индекс комбинации, первый кадр, последний речевой кадр, кадр закрытия)].
+    """
+    p = len(thresholds)
+    frame_samples = sample_rate * FRAME_MS // 1000
+
+    in_speech = np.zeros(p, bool)
+    silence = np.zeros(p, np.int64)
+    buf_samples = np.zeros(p, np.int64)
+    start = np.zeros(p, np.int64)
+    last_voiced = np.zeros(p, np.int64)
+
+    out = []
+    for k, r in enumerate(rms):
+        voiced = r >= thresholds
+        begin = voiced & ~in_speech
+        start[begin] = k
+        silence[begin] = 0
+        last_voiced[voiced] = k
+
+        quiet = ~voiced & in_speech
+        in_speech |= voiced
+        buf_samples[in_speech] += frame_samples
+        silence[quiet] += FRAME_MS
+
+        closed = quiet & (silence >= end_sil)
+        if closed.any():
+            idx = np.nonzero(closed)[0]
+            # то же выражение, что и в UtteranceSegmenter, чтобы совпасть на границах
+            utter_ms = np.floor(buf_samples[idx] / sample_rate * 1000)
+            for i in idx[utter_ms >= min_utt[idx]]:
+                out.append((int(i), int(start[i]), int(last_voiced[i]), k))
+            in_speech[idx] = False
+            silence[idx] = 0
+            buf_samples[idx] = 0
+    return out
+
+
+def score(utterances: list, labels: list | None, p: int) -> np.ndarray:
+    """
+    Сводка по файлу для каждой комбинации:
+    [высказываний, ложных срабатываний, меток речи, пропущенных меток, сумма задержек, число задержек,
+    высказываний в размеченных файлах] — последнее знаменатель доли ложных срабатываний.
+    Задержка эндпойнта — от конца размеченной речи до закрытия высказывания.
+    """
+    stats = np.zeros((p, 7))
+    fs = FRAME_MS / 1000.0
+    by_param = {}
+    for i, first, last, closed in utterances:
+        by_param.setdefault(i, []).append((first * fs, (last + 1) * fs, (closed + 1) * fs))
+
+    for i in range(p):
+        utts = by_param.get(i, [])
+        stats[i, 0] = len(utts)
+        if labels is None:
+            continue
+        stats[i, 2] = len(labels)
+        stats[i, 6] = len(utts)
+        hit = [False] * len(labels)
+        for u_start, u_end, u_closed in utts:
+            matched = [j for j, (l_start, l_end) in enumerate(labels) if u_start < l_end and l_start < u_end]
+            if not matched:
+                stats[i, 1] += 1
+                continue
+            for j in matched:
+                hit[j] = True
+            stats[i, 4] += u_closed - labels[matched[-1]][1]
+            stats[i, 5] += 1
+        stats[i, 3] = hit.count(False)
+    return stats
+
+
+def evaluate_file(path: str, grid: np.ndarray, raw_format: str, raw_rate: int):
+    pcm, rate = read_audio(path, raw_format, raw_rate)
+    rms = frame_rms(pcm, rate)
+    utterances = sweep(rms, rate, grid[:, 0], grid[:, 1], grid[:, 2])
+    labels = read_labels(path)
+    return path, len(rms) * FRAME_MS / 1000.0, labels is not None, score(utterances, labels, len(grid))
+
+
+def verify_file(path: str, raw_format: str, raw_rate: int) -> bool:
+    """
+    Сверка векторного автомата с UtteranceSegmenter на текущих настройках.
+    """
+    pcm, rate = read_audio(path, raw_format, raw_rate)
+    n = rate * FRAME_MS // 1000 * 2
+    seg = UtteranceSegmenter(rate)
+    reference = []
+    for k in range(len(pcm) // n):
+        if seg.push(pcm[k * n:(k + 1) * n]):
+            reference.append(k)
+    grid = np.array([[RMS_SPEECH_THRESHOLD, MIN_UTTERANCE_MS, END_SILENCE_MS]], dtype=np.float64)
+    swept = [closed for _i, _s, _l, closed in sweep(frame_rms(pcm, rate), rate, grid[:, 0], grid[:, 1], grid[:, 2])]
+    return swept == reference
+
+
+def _int_list(value: str) -> list[int]:
+    values = [int(v) for v in value.split(",") if v.strip()]
+    if not values:
+        raise argparse.ArgumentTypeError("expected a comma-separated list of integers")
+    return values
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline VAD/endpointing evaluation over recorded calls")
+    ap.add_argument("corpus", help="directory with recorded call audio")
+    ap.add_argument("--glob", default="*", help="file pattern inside the corpus (default: *)")
+    ap.add_argument("--raw-format", choices=("ulaw", "slin"), default="ulaw", help="encoding of .raw files")
+    ap.add_argument("--raw-rate", type=int, default=8000, help="sample rate of raw files")
+    ap.add_argument("--threshold", type=_int_list, default=[RMS_SPEECH_THRESHOLD])
+    ap.add_argument("--min-utterance", type=_int_list, default=[MIN_UTTERANCE_MS])
+    ap.add_argument("--end-silence", type=_int_list, default=[END_SILENCE_MS])
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--csv", help="write the full result table to this CSV file")
+    ap.add_argument("--verify", action="store_true",
+                    help="check the vectorized sweep against UtteranceSegmenter on the first readable file")
+    args = ap.parse_args(argv)
+
+    exts = (".wav", ".raw") + ULAW_EXTS + SLIN_EXTS
+    files = sorted(p for p in glob.glob(os.path.join(args.corpus, "**", args.glob), recursive=True)
+                   if os.path.splitext(p)[1].lower() in exts)
+    if not files:
+        print(f"[vad_eval] no audio files in {args.corpus}")
+        return 1
+
+    if args.verify:
+        for path in files:
+            try:
+                ok = verify_file(path, args.raw_format, args.raw_rate)
+            except Exception as e:
+                print(f"[vad_eval] skipped {path}: {e}")
+                continue
+            print(f"[vad_eval] verify on {path}: {'OK' if ok else 'MISMATCH'}")
+            if not ok:
+                return 2
+            break
+        else:
+            print(f"[vad_eval] verify: no readable files in {args.corpus}")
+            return 1
+
+    grid = np.array(list(itertools.product(args.threshold, args.min_utterance, args.end_silence)), dtype=np.float64)
+    totals = np.zeros((len(grid), 7))
+    audio_sec = 0.0
+    labeled = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(evaluate_file, f, grid, args.raw_format, args.raw_rate) for f in files]
+        for path, fut in zip(files, futures):
+            try:
+                _path, seconds, has_labels, stats = fut.result()
+            except Exception as e:
+                print(f"[vad_eval] skipped {path}: {e}")
+                continue
+            audio_sec += seconds
+            labeled += has_labels
+            totals += stats
+
+    print(f"[vad_eval] {len(files)} files, {audio_sec / 60:.1f} min of audio, {labeled} labeled, "
+          f"{len(grid)} parameter sets")
+
+    rows = []
+    for (thr, min_utt, end_sil), (utts, false_trig, segs, missed, lat_sum, lat_n, labeled_utts) in zip(grid, totals):
+        rows.append({
+            "threshold": int(thr), "min_utterance_ms": int(min_utt), "end_silence_ms": int(end_sil),
+            "utterances": int(utts),
+            "utterances_per_min": utts / (audio_sec / 60) if audio_sec else 0.0,
+            "false_trigger_rate": false_trig / labeled_utts if labeled_utts else None,
+            "missed_speech_rate": missed / segs if segs else None,
+            "endpoint_latency_ms": 1000 * lat_sum / lat_n if lat_n else None,
+        })
+
+    if labeled:
+        rows.sort(key=lambda r: ((r["missed_speech_rate"] or 0) + (r["false_trigger_rate"] or 0),
+                                 r["endpoint_latency_ms"] or 0))
+
+    def fmt(v, spec):
+        return "-" if v is None else format(v, spec)
+
+    print(f"{'thr':>5} {'min_ms':>6} {'end_ms':>6} {'utts':>6} {'utt/min':>7} {'false%':>7} {'missed%':>7} {'lat_ms':>7}")
+    for r in rows:
+        print(f"{r['threshold']:>5} {r['min_utterance_ms']:>6} {r['end_silence_ms']:>6} {r['utterances']:>6} "
+              f"{r['utterances_per_min']:>7.2f} "
+              f"{fmt(r['false_trigger_rate'] and 100 * r['false_trigger_rate'], '>7.1f')} "
+              f"{fmt(r['missed_speech_rate'] and 100 * r['missed_speech_rate'], '>7.1f')} "
+              f"{fmt(r['endpoint_latency_ms'], '>7.0f')}")
+
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8") as f:
+            f.write(",".join(rows[0].keys()) + "\n")
+            for r in rows:
+                f.write(",".join("" if v is None else str(v) for v in r.values()) + "\n")
+        print(f"[vad_eval] table written to {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
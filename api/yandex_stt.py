@@ -12,6 +12,14 @@ def recognize_pcm(pcm_s16le: bytes, sample_rate: int = 8000, timeout: int = 30)
     Yandex STT recognize: принимает raw PCM s16le mono.
     Возвращает текст или пустую строку.
     """
+    return recognize_audio(pcm_s16le, "lpcm", sample_rate=sample_rate, timeout=timeout)
+
+
+def recognize_audio(data: bytes, audio_format: str = "lpcm", sample_rate: int = 8000, timeout: int = 30) -> str:
+    """
+    Yandex STT recognize для lpcm (raw PCM s16le mono) или oggopus.
+    sample_rate передаётся только для lpcm: у oggopus частота записана в самом потоке.
+    """
     if not YANDEX_API_KEY:
         raise RuntimeError("YANDEX_API_KEY not set")
 
@@ -19,11 +27,12 @@ def recognize_pcm(pcm_s16le: bytes, sample_rate: int = 8000, timeout: int = 30)
     headers = {"Authorization": f"Api-Key {YANDEX_API_KEY}"}
     params = {
         "lang": "ru-RU",
-        "format": "lpcm",
-        "sampleRateHertz": str(sample_rate),
+        "format": audio_format,
     }
+    if audio_format == "lpcm":
+        params["sampleRateHertz"] = str(sample_rate)
 
-    r = requests.post(url, headers=headers, params=params, data=pcm_s16le, timeout=timeout)
+    r = requests.post(url, headers=headers, params=params, data=data, timeout=timeout)
 
     if r.status_code != 200:
         # Не прячем причину (403/401 и т.п.)
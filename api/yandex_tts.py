@@ -9,9 +9,9 @@ YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
 
 
-def synthesize_pcm(text: str, timeout: int = 30) -> bytes:
+def synthesize_pcm(text: str, sample_rate: int = 8000, timeout: int = 30) -> bytes:
     """
-    Yandex TTS: возвращает PCM s16le mono 8000 Hz (lpcm).
+    Yandex TTS: возвращает PCM s16le mono (lpcm) с частотой sample_rate (8000/16000/48000).
     """
     if not YANDEX_API_KEY or not YANDEX_FOLDER_ID:
         raise RuntimeError("YANDEX_API_KEY / YANDEX_FOLDER_ID not set")
@@ -24,7 +24,7 @@ def synthesize_pcm(text: str, timeout: int = 30) -> bytes:
         "voice": "oksana",
         "folderId": YANDEX_FOLDER_ID,
         "format": "lpcm",
-        "sampleRateHertz": "8000",
+        "sampleRateHertz": str(sample_rate),
     }
 
     r = requests.post(url, headers=headers, params=params, timeout=timeout)
@@ -32,17 +32,17 @@ def synthesize_pcm(text: str, timeout: int = 30) -> bytes:
     return r.content
 
 
-def synthesize_wav(text: str, wav_path: str, timeout: int = 30) -> str:
+def synthesize_wav(text: str, wav_path: str, sample_rate: int = 8000, timeout: int = 30) -> str:
     """
-    Утилита: TTS -> WAV (PCM s16le mono 8000).
+    Утилита: TTS -> WAV (PCM s16le mono, sample_rate).
     """
-    pcm = synthesize_pcm(text, timeout=timeout)
+    pcm = synthesize_pcm(text, sample_rate=sample_rate, timeout=timeout)
 
     os.makedirs(os.path.dirname(wav_path) or ".", exist_ok=True)
     with wave.open(wav_path, "wb") as wf:
         wf.setnchannels(1)
         wf.setsampwidth(2)   # 16-bit
-        wf.setframerate(8000)
+        wf.setframerate(sample_rate)
         wf.writeframes(pcm)
 
     return wav_path